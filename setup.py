@@ -45,6 +45,7 @@ if sys.version_info.major == 2:
     ])
 
 tests_require = [
+    'moto',
     'pytest>=2.4.0',
     'pytest-bdd',
     'pytest-mock',
@@ -73,8 +74,11 @@ setup(
         [console_scripts]
         batchupgrade = snowfort.batchupgrade:main
         create-mapping = snowfort.elasticsearch.create_mapping:main
+        es-index-worker = snowfort.elasticsearch.queueindexer:main
+        upgrade-schema = snowfort.schema_upgrade:main
 
         add-date-created = encoded.commands.add_date_created:main
+        benchmark-indexing = encoded.commands.benchmark_indexing:main
         check-rendering = encoded.commands.check_rendering:main
         deploy = encoded.commands.deploy:main
         dev-servers = encoded.commands.dev_servers:main
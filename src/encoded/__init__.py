@@ -64,8 +64,8 @@ def changelogs(config):
         'profiles/changelogs', 'schemas/changelogs', cache_max_age=STATIC_MAX_AGE)
 
 
-def configure_engine(settings):
-    engine_url = settings['sqlalchemy.url']
+def configure_engine(settings, prefix='sqlalchemy.'):
+    engine_url = settings[prefix + 'url']
     engine_opts = {}
     if engine_url.startswith('postgresql'):
         if settings.get('indexer_worker'):
@@ -79,7 +79,7 @@ def configure_engine(settings):
             json_serializer=json_renderer.dumps,
             connect_args={'application_name': application_name}
         )
-    engine = engine_from_config(settings, 'sqlalchemy.', **engine_opts)
+    engine = engine_from_config(settings, prefix, **engine_opts)
     if engine.url.drivername == 'postgresql':
         timeout = settings.get('postgresql.statement_timeout')
         if timeout:
@@ -107,9 +107,13 @@ def set_postgresql_statement_timeout(engine, timeout=20 * 1000):
 
 
 def configure_dbsession(config):
-    from snowfort import DBSESSION
+    from snowfort import (
+        DBSESSION,
+        REPLICA_DBSESSION,
+    )
     settings = config.registry.settings
     DBSession = settings.pop(DBSESSION, None)
+    ReplicaDBSession = settings.pop(REPLICA_DBSESSION, None)
     if DBSession is None:
         engine = configure_engine(settings)
 
@@ -125,7 +129,15 @@ def configure_dbsession(config):
         zope.sqlalchemy.register(DBSession)
         snowfort.storage.register(DBSession)
 
+        # Optional streaming replica for read only transactions.
+        if settings.get('sqlalchemy_replica.url'):
+            replica_engine = configure_engine(settings, 'sqlalchemy_replica.')
+            ReplicaDBSession = orm.scoped_session(orm.sessionmaker(bind=replica_engine))
+            zope.sqlalchemy.register(ReplicaDBSession)
+
     config.registry[DBSESSION] = DBSession
+    if ReplicaDBSession is not None:
+        config.registry[REPLICA_DBSESSION] = ReplicaDBSession
 
 
 def load_workbook(app, workbook_filename, docsdir, test=False):
@@ -176,10 +176,9 @@ def audit_file_controlled_by(value, system):
     if 'target' in value['dataset'] and 'control' in value['dataset']['target'].get('investigated_as', []):
         return
 
-    if 'controlled_by' not in value:
-        value['controlled_by'] = []
+    controlled_by = value.get('controlled_by', [])
 
-    if (value['controlled_by'] == []) and (value['file_format'] in ['fastq']):
+    if (controlled_by == []) and (value['file_format'] in ['fastq']):
         detail = 'Fastq file {} from {} requires controlled_by'.format(
             value['@id'],
             value['dataset']['assay_term_name']
@@ -192,8 +191,8 @@ def audit_file_controlled_by(value, system):
     run_type = value.get('run_type', None)
     read_length = value.get('read_length', None)
 
-    if value['controlled_by']:
-        for ff in value['controlled_by']:
+    if controlled_by:
+        for ff in controlled_by:
             control_bs = ff['dataset'].get('biosample_term_id')
             control_run = ff.get('run_type', None)
             control_length = ff.get('read_length', None)
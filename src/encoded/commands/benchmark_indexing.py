@@ -0,0 +1,316 @@
+"""\
+Benchmark indexing throughput
+
+Starts postgres and elasticsearch in a scratch datadir, loads the test
+inserts with the experiment graph (experiments, replicates, libraries,
+biosamples and files) copied ``--scale`` times, then times a full /index
+pass with the single process and the multiprocessing indexers.
+
+For the development.ini you must supply the paster app name:
+
+    %(prog)s development.ini --app-name app --scale 10 --output indexing.json
+
+"""
+from pkg_resources import resource_filename
+from pyramid.paster import get_appsettings
+from snowfort.elasticsearch import INDEXER
+from snowfort.elasticsearch.indexer import (
+    Indexer,
+    merge_stats,
+)
+import hashlib
+import json
+import logging
+import os.path
+import psutil
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+EPILOG = __doc__
+
+logger = logging.getLogger(__name__)
+
+# Copied with their links to each other remapped to the copies
+GRAPH_TYPES = {
+    'experiment': 'SR',
+    'replicate': None,
+    'library': 'LB',
+    'biosample': 'BS',
+    'file': 'FF',
+}
+ACCESSION_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def read_inserts(inserts):
+    workbook = {}
+    for filename in sorted(os.listdir(inserts)):
+        item_type, ext = os.path.splitext(filename)
+        if ext == '.json':
+            with open(os.path.join(inserts, filename)) as f:
+                workbook[item_type] = json.load(f)
+    return workbook
+
+
+def accessions(code, existing):
+    """ Generate unused ENC accessions for the code
+    """
+    for letters in range(len(ACCESSION_LETTERS) ** 3):
+        suffix = ''.join(
+            ACCESSION_LETTERS[letters // len(ACCESSION_LETTERS) ** power % len(ACCESSION_LETTERS)]
+            for power in (2, 1, 0)
+        )
+        for number in range(1000):
+            accession = 'ENC%s%03d%s' % (code, number, suffix)
+            if accession not in existing:
+                yield accession
+
+
+def remap(value, mapping):
+    if isinstance(value, dict):
+        return {k: remap(v, mapping) for k, v in value.items()}
+    if isinstance(value, list):
+        return [remap(v, mapping) for v in value]
+    if isinstance(value, str) and value.startswith('/'):
+        # Links may also be written as paths, /experiments/ENCSR000AAA/
+        parts = value.split('/')
+        if len(parts) == 4 and parts[2] in mapping:
+            return mapping[parts[2]]
+    return mapping.get(value, value)
+
+
+def generate_workbook(workbook, scale):
+    """ Return a copy of workbook with the experiment graph repeated scale times.
+    """
+    existing = {
+        accession
+        for items in workbook.values() for item in items
+        for accession in [item.get('accession')] + item.get('alternate_accessions', [])
+    }
+    generators = {
+        code: accessions(code, existing)
+        for code in GRAPH_TYPES.values() if code is not None
+    }
+    result = {item_type: list(items) for item_type, items in workbook.items()}
+    for copy in range(1, scale):
+        # Map every identifier of the original graph to the copy's uuid
+        mapping = {}
+        copies = []
+        for item_type, code in GRAPH_TYPES.items():
+            for item in workbook.get(item_type, []):
+                candidates = [item.get('uuid'), item.get('accession')] + item.get('aliases', [])
+                identifiers = [identifier for identifier in candidates if identifier]
+                item_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, '%s/%d' % (identifiers[0], copy)))
+                mapping.update((identifier, item_uuid) for identifier in identifiers)
+                copies.append((item_type, code, item_uuid, item))
+
+        for item_type, code, item_uuid, item in copies:
+            item = remap(item, mapping)
+            item['uuid'] = item_uuid
+            item.pop('alternate_accessions', None)
+            if code is not None:
+                item['accession'] = next(generators[code])
+            if 'aliases' in item:
+                item['aliases'] = ['%s-copy%d' % (alias, copy) for alias in item['aliases']]
+            for key in ('md5sum', 'content_md5sum'):
+                if key in item:
+                    value = '%s%d' % (item[key], copy)
+                    item[key] = hashlib.md5(value.encode('utf-8')).hexdigest()
+            result[item_type].append(item)
+    return result
+
+
+def write_workbook(workbook, path):
+    for item_type, items in workbook.items():
+        with open(os.path.join(path, item_type + '.json'), 'w') as f:
+            json.dump(items, f)
+
+
+def percentile(values, point):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * point // 100)]
+
+
+class StatsRecorder(object):
+    """ Wrap an indexer to keep the stats of the runs it performs.
+    """
+    def __init__(self, indexer):
+        self.indexer = indexer
+        self.stats = {}
+
+    def update_objects(self, request, uuids, xmin, snapshot_id, index=None, stats=None):
+        run_stats = {}
+        errors = self.indexer.update_objects(request, uuids, xmin, snapshot_id, index, run_stats)
+        merge_stats(self.stats, run_stats)
+        if stats is not None:
+            merge_stats(stats, run_stats)
+        return errors
+
+    def __getattr__(self, name):
+        return getattr(self.indexer, name)
+
+
+def benchmark(app, indexer):
+    from snowfort.elasticsearch import create_mapping
+    from webtest import TestApp
+    # Start from an empty index so no documents are skipped as unchanged.
+    create_mapping.run(app)
+    recorder = StatsRecorder(indexer)
+    app.registry[INDEXER] = recorder
+    testapp = TestApp(app, {
+        'HTTP_ACCEPT': 'application/json',
+        'REMOTE_USER': 'INDEXER',
+    })
+    sampler = PeakRSS()
+    sampler.start()
+    start = time.time()
+    try:
+        res = testapp.post_json('/index', {'last_xmin': None})
+        seconds = time.time() - start
+    finally:
+        peak_rss = sampler.stop()
+    indexer.shutdown()
+
+    types = {}
+    for item_type, type_stats in sorted(recorder.stats.get('types', {}).items()):
+        times = type_stats.get('render_times', [])
+        types[item_type] = {
+            'rendered': type_stats['rendered'],
+            'p50': percentile(times, 50) if times else None,
+            'p99': percentile(times, 99) if times else None,
+        }
+    return {
+        'indexed': res.json.get('indexed', 0),
+        'errors': len(res.json.get('errors', [])),
+        'seconds': seconds,
+        'docs_per_second': res.json.get('indexed', 0) / seconds,
+        'types': types,
+        'peak_rss_kb': peak_rss // 1024,
+    }
+
+
+class PeakRSS(threading.Thread):
+    """ Sample the RSS of this process and all its descendants while running.
+
+    The descendants include the forkserver and the MPIndexer pool workers it
+    starts. Pages shared after a fork are counted once per process.
+    """
+    def __init__(self, interval=0.1):
+        super(PeakRSS, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        self.peak = max(self.peak, rss)
+
+    def run(self):
+        self.sample()
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def run(app, scale, processes=None):
+    from encoded.loadxl import load_all
+    from snowfort.elasticsearch.mpindexer import MPIndexer
+    from webtest import TestApp
+
+    inserts = resource_filename('encoded', 'tests/data/inserts/')
+    docsdir = [resource_filename('encoded', 'tests/data/documents/')]
+    workbook = generate_workbook(read_inserts(inserts), scale)
+    workdir = tempfile.mkdtemp()
+    try:
+        write_workbook(workbook, workdir)
+        testapp = TestApp(app, {
+            'HTTP_ACCEPT': 'application/json',
+            'REMOTE_USER': 'TEST',
+        })
+        start = time.time()
+        load_all(testapp, workdir, docsdir)
+        load_seconds = time.time() - start
+    finally:
+        shutil.rmtree(workdir)
+
+    results = {
+        'scale': scale,
+        'items': sum(len(items) for items in workbook.values()),
+        'load_seconds': load_seconds,
+        'runs': {},
+    }
+    results['runs']['Indexer'] = benchmark(app, Indexer(app.registry))
+    mpindexer = MPIndexer(app.registry, processes=processes)
+    results['runs']['MPIndexer'] = benchmark(app, mpindexer)
+    results['runs']['MPIndexer']['processes'] = processes
+    return results
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Benchmark indexing throughput", epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument('config_uri', help="path to configfile")
+    parser.add_argument('--scale', type=int, default=1, help="Copies of the experiment graph")
+    parser.add_argument('--processes', type=int, help="MPIndexer processes")
+    parser.add_argument('--datadir', default='/tmp/encoded-benchmark', help="path to datadir")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+
+    from encoded.tests import elasticsearch_fixture, postgresql_fixture
+    datadir = os.path.abspath(args.datadir)
+    pgdata = os.path.join(datadir, 'pgdata')
+    esdata = os.path.join(datadir, 'esdata')
+    for dirname in [pgdata, esdata]:
+        if os.path.exists(dirname):
+            shutil.rmtree(dirname)
+    postgresql_fixture.initdb(pgdata)
+    postgres = postgresql_fixture.server_process(pgdata)
+    elasticsearch = elasticsearch_fixture.server_process(esdata)
+    try:
+        from encoded import main as app_factory
+        settings = get_appsettings(args.config_uri, args.app_name)
+        settings.update({
+            'sqlalchemy.url': 'postgresql://postgres@:5432/postgres?host=%s' % pgdata,
+            'elasticsearch.server': 'localhost:9200',
+            'create_tables': 'true',
+            'load_workbook': '',
+            'indexer': 'true',
+            'indexer.record_timings': 'true',
+        })
+        app = app_factory(settings)
+        results = run(app, args.scale, args.processes)
+    finally:
+        for process in [postgres, elasticsearch]:
+            process.terminate()
+            process.wait()
+
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ from webtest import TestApp
 from snowfort import STORAGE
 from snowfort.elasticsearch import ELASTIC_SEARCH
 import atexit
+import collections
 import datetime
 import elasticsearch.exceptions
 import json
@@ -28,6 +29,8 @@ log = logging.getLogger(__name__)
 
 EPILOG = __doc__
 DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_DELAY = 10
+LATENCY_WINDOW = 1000
 PY2 = sys.version_info[0] == 2
 
 # We need this because of MVCC visibility.
@@ -35,7 +38,33 @@ PY2 = sys.version_info[0] == 2
 # https://devcenter.heroku.com/articles/postgresql-concurrency
 
 
-def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=None, update_status=None):
+def percentiles(values, points=(50, 90, 99)):
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {
+        'p%d' % point: values[min(len(values) - 1, len(values) * point // 100)]
+        for point in points
+    }
+    result['max'] = values[-1]
+    result['count'] = len(values)
+    return result
+
+
+def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=None,
+        update_status=None, debounce=0, min_interval=0, max_delay=DEFAULT_MAX_DELAY,
+        referencing_delay=0):
+    """ Index after notifications of new transactions.
+
+    Notifications are coalesced into one indexing pass: after the first
+    the pass waits until none arrive for ``debounce`` seconds and at least
+    ``min_interval`` seconds have passed since the previous pass started,
+    but never longer than ``max_delay`` seconds after the first.
+
+    Documents which embed the edited items are indexed afterwards by
+    referencing passes, one chunk at a time and at most one every
+    ``referencing_delay`` seconds, interleaved with the indexing passes.
+    """
     assert update_status is not None
 
     timestamp = datetime.datetime.now().isoformat()
@@ -50,6 +79,11 @@ def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=
     es.info()
 
     max_xid = 0
+    last_pass = 0
+    last_referencing = 0
+    referencing_pending = 0
+    # Commit to searchable seconds of recently indexed transactions
+    latencies = collections.deque(maxlen=LATENCY_WINDOW)
     DBSession = testapp.app.registry[STORAGE].write.DBSession
     engine = DBSession.bind  # DBSession.bind is configured by app init
     # noqa http://docs.sqlalchemy.org/en/latest/faq.html#how-do-i-get-at-the-raw-dbapi-connection-when-using-an-engine
@@ -89,6 +123,7 @@ def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=
                     max_xid=max_xid,
                 )
 
+                last_pass = time.time()
                 try:
                     res = testapp.post_json(path, {
                         'record': True,
@@ -112,8 +147,48 @@ def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=
                     }
                     result['timestamp'] = timestamp
                     update_status(last_result=result)
+                    referencing_pending = result.get('referencing_pending', 0)
                     if result.get('indexed', 0):
-                        update_status(result=result)
+                        if 'max_xid' in result:
+                            cursor.execute(
+                                """SELECT extract(epoch FROM now() - timestamp) FROM transactions
+                                WHERE xid >= %s AND xid <= %s;""",
+                                (result['last_xmin'], result['max_xid']))
+                            latencies.extend(float(latency) for latency, in cursor.fetchall())
+                        update_status(
+                            result=result,
+                            latency=percentiles(latencies),
+                            updated_lag=result.get('updated_lag'),
+                            skipped=result.get('skipped', 0),
+                        )
+                        log.info(result)
+
+                if referencing_pending and not dry_run and \
+                        time.time() - last_referencing >= referencing_delay:
+                    last_referencing = time.time()
+                    try:
+                        res = testapp.post_json(path, {
+                            'referencing': True,
+                            'recovery': recovery,
+                        })
+                    except Exception as e:
+                        timestamp = datetime.datetime.now().isoformat()
+                        log.exception('referencing pass failed')
+                        update_status(error={
+                            'error': repr(e),
+                            'timestamp': timestamp,
+                        })
+                    else:
+                        timestamp = datetime.datetime.now().isoformat()
+                        result = res.json
+                        result['timestamp'] = timestamp
+                        referencing_pending = result['referencing_pending']
+                        update_status(
+                            result=result,
+                            referencing_pending=referencing_pending,
+                        )
+                        if 'referencing_lag' in result:
+                            update_status(referencing_lag=result['referencing_lag'])
                         log.info(result)
 
                 update_status(
@@ -121,8 +196,12 @@ def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=
                     timestamp=timestamp,
                     max_xid=max_xid,
                 )
+                wait = timeout
+                if referencing_pending and not dry_run:
+                    # Come back for the next referencing chunk
+                    wait = max(0, min(timeout, last_referencing + referencing_delay - time.time()))
                 # Wait on notifcation
-                readable, writable, err = select.select(sockets, [], sockets, timeout)
+                readable, writable, err = select.select(sockets, [], sockets, wait)
 
                 if err:
                     raise Exception('Socket error')
@@ -134,14 +213,40 @@ def run(testapp, timeout=DEFAULT_TIMEOUT, dry_run=False, path='/index', control=
                         # Other end shutdown
                         return
 
-                if conn in readable:
-                    conn.poll()
-
-                while conn.notifies:
-                    notify = conn.notifies.pop()
-                    xid = int(notify.payload)
-                    max_xid = max(max_xid, xid)
-                    log.debug('NOTIFY %s, %s', notify.channel, notify.payload)
+                first_notify = None
+                while True:
+                    if conn in readable:
+                        conn.poll()
+
+                    if conn.notifies:
+                        last_notify = time.time()
+                        if first_notify is None:
+                            first_notify = last_notify
+                    while conn.notifies:
+                        notify = conn.notifies.pop()
+                        xid = int(notify.payload)
+                        max_xid = max(max_xid, xid)
+                        log.debug('NOTIFY %s, %s', notify.channel, notify.payload)
+
+                    if first_notify is None:
+                        break
+                    # Coalesce further notifications into the next pass
+                    now = time.time()
+                    wait = min(
+                        max(last_notify + debounce, last_pass + min_interval),
+                        first_notify + max_delay,
+                    ) - now
+                    if wait <= 0:
+                        break
+                    readable, writable, err = select.select(sockets, [], sockets, wait)
+                    if err:
+                        raise Exception('Socket error')
+                    if control in readable:
+                        command = control.recv(1)
+                        log.debug('received command: %r', command)
+                        if not command:
+                            # Other end shutdown
+                            return
 
     finally:
         connection.close()
@@ -247,8 +352,9 @@ def composite(loader, global_conf, **settings):
         'update_status': update_status,
         'path': path,
     }
-    if 'timeout' in settings:
-        kwargs['timeout'] = float(settings['timeout'])
+    for name in ('timeout', 'debounce', 'min_interval', 'max_delay', 'referencing_delay'):
+        if name in settings:
+            kwargs[name] = float(settings[name])
 
     listener = ErrorHandlingThread(target=run, name='listener', kwargs=kwargs)
     listener.daemon = True
@@ -301,6 +407,18 @@ def main():
     parser.add_argument(
         '--poll-interval', type=int, default=DEFAULT_TIMEOUT,
         help="Poll interval between notifications")
+    parser.add_argument(
+        '--debounce', type=float, default=0,
+        help="Seconds without notifications before indexing")
+    parser.add_argument(
+        '--min-interval', type=float, default=0,
+        help="Minimum seconds between the start of indexing passes")
+    parser.add_argument(
+        '--max-delay', type=float, default=DEFAULT_MAX_DELAY,
+        help="Maximum seconds to delay indexing after a notification")
+    parser.add_argument(
+        '--referencing-delay', type=float, default=0,
+        help="Minimum seconds between referencing passes")
     parser.add_argument(
         '--path', default='/index',
         help="Path of indexing view (/index or /index_file)")
@@ -314,7 +432,10 @@ def main():
     if args.verbose or args.dry_run:
         logging.getLogger('encoded').setLevel(logging.DEBUG)
 
-    return run(testapp, args.poll_interval, args.dry_run, args.path)
+    return run(
+        testapp, args.poll_interval, args.dry_run, args.path, debounce=args.debounce,
+        min_interval=args.min_interval, max_delay=args.max_delay,
+        referencing_delay=args.referencing_delay)
 
 
 if __name__ == '__main__':
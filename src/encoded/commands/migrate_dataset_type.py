@@ -27,8 +27,7 @@ TYPE_MAP = {
 def run(app):
     storage = app.registry[STORAGE].write
 
-    for rid in storage.__iter__('dataset'):
-        model = storage.get_by_uuid(str(rid))
+    for model in storage.iter_models('dataset'):
         dataset_type = model.properties['dataset_type']
         new_type = TYPE_MAP[dataset_type]
         model.item_type = new_type
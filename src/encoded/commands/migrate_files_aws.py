@@ -8,6 +8,7 @@ import transaction
 from pyramid.paster import get_app
 from pyramid.threadlocal import manager
 from pyramid.testing import DummyRequest
+from snowfort.interfaces import CONNECTION
 
 EPILOG = __doc__
 
@@ -19,12 +20,12 @@ def run(app, files):
     collection = root['file']
     dummy_request = DummyRequest(root=root, registry=app.registry, _stats={})
     manager.push({'request': dummy_request, 'registry': app.registry})
-    for i, uuid in enumerate(collection):
-        item = root.get_by_uuid(uuid)
+    connection = app.registry[CONNECTION]
+    for i, item in enumerate(connection.iter_items(*collection.type_info.subtypes)):
         dummy_request.context = item
         properties = item.upgrade_properties()
         sheets = None
-        value = files.get(str(uuid))
+        value = files.get(str(item.uuid))
         if value is not None:
             properties['file_size'] = value['file_size']
             sheets = {
@@ -11,10 +11,15 @@ For the development.ini you must supply the paster app name:
 
     %(prog)s development.ini --app-name app "/experiments/ENCSR000ADI/?format=json&datastore=database"
 
+To time rendering of a large experiment without profiling:
+
+    %(prog)s production.ini --benchmark 10 "/experiments/ENCSR000ADI/@@index-data"
+
 """
 import logging
 import cProfile
 import pstats
+import time
 
 EPILOG = __doc__
 
@@ -47,6 +52,22 @@ def parse_restriction(value):
     return value
 
 
+def benchmark(testapp, path, warm_ups, repeat):
+    for n in range(warm_ups):
+        testapp.get(path)
+    timings = []
+    for n in range(repeat):
+        start = time.time()
+        res = testapp.get(path)
+        timings.append(time.time() - start)
+        logger.info(
+            'Run %d: %.3fs\n\t%s', n + 1, timings[-1],
+            res.headers['X-Stats'].replace('&', '\n\t'))
+    timings.sort()
+    print('runs: %d min: %.3fs median: %.3fs max: %.3fs' % (
+        repeat, timings[0], timings[len(timings) // 2], timings[-1]))
+
+
 def run(testapp, method, path, data, warm_ups, filename, sortby, stats, callers, callees, response_body):
     method = method.lower()
     if method == 'get':
@@ -90,6 +111,9 @@ def main():
     parser.add_argument('--response-body', action='store_true', help="Print response body")
     parser.add_argument('--method', default='GET', help="HTTP method")
     parser.add_argument('--data', help="json request body")
+    parser.add_argument(
+        '--benchmark', type=int, metavar='N',
+        help="Time N GET requests instead of profiling")
     parser.add_argument(
         '--html', dest='accept_json', action='store_false', default=True,
         help="Don't set 'Accept: application/json'")
@@ -106,6 +130,10 @@ def main():
     # Loading app will have configured from config file. Reconfigure here:
     logging.getLogger('encoded').setLevel(logging.DEBUG)
 
+    if args.benchmark:
+        benchmark(testapp, args.path, args.warm_ups, args.benchmark)
+        return
+
     run(testapp, args.method, args.path, args.data, args.warm_ups, args.filename, args.sortby,
         args.stat, args.caller, args.callee, args.response_body)
 
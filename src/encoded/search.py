@@ -6,17 +6,22 @@ from snowfort import (
 )
 from snowfort.elasticsearch import ELASTIC_SEARCH
 from snowfort.resource_views import collection_view_listing_db
+from snowfort.util import get_root_request
 from elasticsearch.helpers import scan
 from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.security import effective_principals
 from urllib.parse import urlencode
 from collections import OrderedDict
+from .search_cache import SEARCH_CACHE
+import functools
+import json
 
 
 def includeme(config):
     config.add_route('search', '/search{slash:/?}')
     config.add_route('report', '/report{slash:/?}')
     config.add_route('matrix', '/matrix{slash:/?}')
+    config.include('.search_cache')
     config.scan(__name__)
 
 
@@ -440,8 +445,44 @@ def normalize_query(request):
     return '?' + qs if qs else ''
 
 
+def cached_search(view):
+    """ Serve the view's results from the search cache when configured.
+
+    Bypassed for users whose own edits may not have been indexed yet.
+    """
+    @functools.wraps(view)
+    def wrapper(context, request, *args):
+        cache = request.registry.get(SEARCH_CACHE)
+        if cache is None or dict.get(request.session, 'edits', None):
+            return view(context, request, *args)
+        es = request.registry[ELASTIC_SEARCH]
+        index = request.registry.settings['snowfort.elasticsearch.index']
+        generation = cache.current_generation(es, index)
+        if generation is None:
+            return view(context, request, *args)
+
+        key = json.dumps([
+            view.__name__, request.path, normalize_query(request),
+            sorted(effective_principals(request)), args,
+        ])
+        stats = getattr(get_root_request(), '_stats', {})
+        cached = cache.get(key, generation)
+        if cached is not None:
+            stats['search_cache_hits'] = stats.get('search_cache_hits', 0) + 1
+            status, value = cached
+            request.response.status_code = status
+            return json.loads(value)
+
+        stats['search_cache_misses'] = stats.get('search_cache_misses', 0) + 1
+        result = view(context, request, *args)
+        # Streamed responses are not cached
+        if isinstance(result, dict):
+            cache.set(key, generation, request.response.status_code, json.dumps(result))
+        return result
+    return wrapper
+
+
 def iter_long_json(name, iterable, **other):
-    import json
 
     before = (json.dumps(other)[:-1] + ',') if other else '{'
     yield before + json.dumps(name) + ':['
@@ -460,6 +501,7 @@ def iter_long_json(name, iterable, **other):
 
 
 @view_config(route_name='search', request_method='GET', permission='search')
+@cached_search
 def search(context, request, search_type=None):
     """
     Search view connects to ElasticSearch and returns the results
@@ -672,6 +714,7 @@ def report(context, request):
 
 
 @view_config(route_name='matrix', request_method='GET', permission='search')
+@cached_search
 def matrix(context, request):
     """
     Return search results aggregated by x and y buckets for building a matrix display.
@@ -0,0 +1,126 @@
+"""\
+Cache of search responses.
+
+Enabled by setting ``search_cache.size`` (e.g. ``200MB``), the budget for the
+serialized responses each process keeps in memory. With
+``search_cache.shared = true`` responses are also stored in the
+``search_cache`` table so that other processes may serve them.
+
+Entries are only served for the index generation they were built from, which
+the indexer advances after each pass.
+"""
+from pyramid.settings import asbool
+from snowfort import DBSESSION
+from snowfort.cache import SizedLRUCache
+from snowfort.elasticsearch.indexer import index_generation
+from snowfort.storage import SearchCacheEntry
+from sqlalchemy.exc import IntegrityError
+import hashlib
+import humanfriendly
+import threading
+import time
+
+SEARCH_CACHE = 'search_cache'
+
+
+def includeme(config):
+    settings = config.registry.settings
+    size = settings.get('search_cache.size')
+    if not size:
+        return
+    DBSession = None
+    if asbool(settings.get('search_cache.shared')):
+        DBSession = config.registry[DBSESSION]
+    config.registry[SEARCH_CACHE] = SearchCache(
+        humanfriendly.parse_size(size), DBSession,
+        float(settings.get('search_cache.generation_interval', 1)))
+
+
+class SearchCache(object):
+    """ Process wide cache of (status, serialized response) by key and generation.
+
+    The index generation is read at most once per ``generation_interval``
+    seconds, so a response may be served for that long after the index
+    has moved on.
+    """
+    def __init__(self, max_size, DBSession=None, generation_interval=1):
+        self.local = SizedLRUCache(max_size, sizeof=lambda value: len(value[1]))
+        self.DBSession = DBSession
+        self.generation_interval = generation_interval
+        self.generation = None
+        self.generation_checked = None
+        self.lock = threading.Lock()
+
+    def current_generation(self, es, index):
+        now = time.time()
+        with self.lock:
+            if self.generation_checked is not None and \
+                    now - self.generation_checked < self.generation_interval:
+                return self.generation
+        generation = index_generation(es, index)
+        with self.lock:
+            self.generation_checked = now
+            # Another thread may have seen a newer generation meanwhile.
+            advanced = generation is not None and (
+                self.generation is None or generation > self.generation)
+            if advanced or generation is None:
+                self.generation = generation
+            generation = self.generation
+        if advanced and self.DBSession is not None:
+            # Workers still on an older generation keep their newer entries.
+            table = SearchCacheEntry.__table__
+            with self.DBSession.bind.begin() as connection:
+                connection.execute(table.delete().where(table.c.generation < generation))
+        return generation
+
+    def get(self, key, generation):
+        # Entries of earlier generations are never hit again so are the
+        # first to be evicted.
+        with self.lock:
+            if (generation, key) in self.local:
+                return self.local[(generation, key)]
+        if self.DBSession is None:
+            return None
+        table = SearchCacheEntry.__table__
+        with self.DBSession.bind.connect() as connection:
+            row = connection.execute(
+                table.select()
+                .where(table.c.key == self.digest(key))
+                .where(table.c.generation == generation)
+            ).first()
+        if row is None:
+            return None
+        value = (row.status, row.value)
+        with self.lock:
+            self.local[(generation, key)] = value
+        return value
+
+    def set(self, key, generation, status, value):
+        with self.lock:
+            self.local[(generation, key)] = (status, value)
+        if self.DBSession is None:
+            return
+        # Update then insert, as postgres 9.3 has no upsert. Entries are
+        # never replaced by those of an older generation.
+        table = SearchCacheEntry.__table__
+        digest = self.digest(key)
+        values = {'generation': generation, 'status': status, 'value': value}
+        for attempt in range(3):
+            try:
+                with self.DBSession.bind.begin() as connection:
+                    result = connection.execute(
+                        table.update()
+                        .where(table.c.key == digest)
+                        .where(table.c.generation <= generation)
+                        .values(**values))
+                    if result.rowcount:
+                        return
+                    connection.execute(table.insert().values(key=digest, **values))
+                    return
+            except IntegrityError:
+                # Inserted concurrently, or a newer entry exists.
+                continue
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,20 @@
+def test_generate_workbook():
+    from pkg_resources import resource_filename
+    from ..commands.benchmark_indexing import (
+        generate_workbook,
+        read_inserts,
+    )
+    workbook = read_inserts(resource_filename('encoded', 'tests/data/inserts/'))
+    generated = generate_workbook(workbook, 3)
+    assert len(generated['experiment']) == 3 * len(workbook['experiment'])
+    assert len(generated['award']) == len(workbook['award'])
+
+    items = [item for items in generated.values() for item in items]
+    for key in ('uuid', 'accession'):
+        values = [item[key] for item in items if key in item]
+        assert len(values) == len(set(values))
+
+    # Copies link to copies, not to the originals
+    copied_uuids = {item['uuid'] for item in generated['experiment'][len(workbook['experiment']):]}
+    copied_replicates = generated['replicate'][len(workbook['replicate']):]
+    assert all(replicate['experiment'] in copied_uuids for replicate in copied_replicates)
@@ -203,3 +203,51 @@ def test_download_create_w_wrong_md5sum(testapp):
         'md5sum': 'deadbeef',
     }}
     testapp.post_json(url, item, status=422)
+
+
+def test_download_range(testapp, testing_download):
+    res = testapp.get(testing_download)
+    attachment = res.json['attachment']
+    url = testing_download + '/' + attachment['href']
+    data = b64decode(RED_DOT.split(',', 1)[1])
+    res = testapp.get(url, headers={'Range': 'bytes=2-9'}, status=206)
+    assert res.body == data[2:10]
+    assert res.headers['Content-Range'] == 'bytes 2-9/%d' % len(data)
+
+
+def test_download_if_none_match(testapp, testing_download):
+    res = testapp.get(testing_download)
+    attachment = res.json['attachment']
+    url = testing_download + '/' + attachment['href']
+    res = testapp.get(url)
+    assert res.etag == attachment['md5sum']
+    res = testapp.get(url, headers={'If-None-Match': '"%s"' % attachment['md5sum']}, status=304)
+    assert res.etag == attachment['md5sum']
+
+
+@pytest.yield_fixture
+def s3_blobs(app, monkeypatch):
+    import boto
+    from moto import mock_s3
+    from snowfort.interfaces import BLOBS
+    from snowfort.storage import S3BlobStorage
+    with mock_s3():
+        boto.connect_s3().create_bucket('test')
+        storage = S3BlobStorage('test', redirect=False)
+        monkeypatch.setitem(app.registry, BLOBS, storage)
+        yield storage
+
+
+def test_download_s3_without_redirect(testapp, s3_blobs):
+    url = '/testing-downloads/'
+    item = {'attachment': {'download': 'red-dot.png', 'href': RED_DOT}}
+    res = testapp.post_json(url, item, status=201)
+    location = res.location
+    res = testapp.get(location)
+    url = location + '/' + res.json['attachment']['href']
+    data = b64decode(RED_DOT.split(',', 1)[1])
+    res = testapp.get(url)
+    assert 'X-Accel-Redirect' not in res.headers
+    assert res.body == data
+    res = testapp.get(url, headers={'Range': 'bytes=2-9'}, status=206)
+    assert res.body == data[2:10]
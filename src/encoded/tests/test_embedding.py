@@ -73,3 +73,52 @@ def test_embedded_uuids_experiment(experiment, replicate, library, biosample, or
     assert library['uuid'] in embedded_uuids
     assert biosample['uuid'] in embedded_uuids
     assert organism['uuid'] in embedded_uuids
+
+
+def test_connection_get_by_uuids(content, dummy_request, threadlocals):
+    from snowfort import CONNECTION
+    conn = dummy_request.registry[CONNECTION]
+    uuids = [targets[1]['uuid'], 'not-a-uuid', targets[0]['uuid']]
+    items = conn.get_by_uuids(uuids)
+    assert [str(item.uuid) for item in items] == [targets[1]['uuid'], targets[0]['uuid']]
+    assert conn.item_cache.get(targets[0]['uuid']) is items[1]
+
+
+def test_connection_caches_misses(content, dummy_request, threadlocals):
+    from snowfort import CONNECTION
+    conn = dummy_request.registry[CONNECTION]
+    missing = 'a1b2c3d4-0000-4000-8000-000000000000'
+    assert conn.get_by_uuid(missing) is None
+    assert missing in conn.miss_cache
+    assert conn.get_by_unique_key('testing_link_target:name', 'missing') is None
+    assert ('testing_link_target:name', 'missing') in conn.miss_cache
+    conn.create('testing_link_target', missing)
+    assert missing not in conn.miss_cache
+
+
+def test_embed_cached_result_is_frozen(content, dummy_request, threadlocals):
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    result = dummy_request.embed(path)
+    assert dummy_request.embed(path) is result
+    with pytest.raises(TypeError):
+        result['name'] = 'changed'
+    copied = result.copy()
+    copied['name'] = 'changed'
+    assert dummy_request.embed(path)['name'] == 'A'
+
+
+def test_expand_path_copies_embedded(content, dummy_request, threadlocals):
+    from snowfort.util import expand_path
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    properties = dummy_request.embed(path).copy()
+    expand_path(dummy_request, properties, 'target')
+    assert properties['target']['uuid'] == targets[0]['uuid']
+    assert isinstance(dummy_request.embed(path)['target'], str)
+
+
+def test_embed_object_in_process(content, dummy_request, threadlocals):
+    from snowfort.embed import _embed, _embed_object
+    path = '/testing-link-sources/%s/@@object' % sources[0]['uuid']
+    assert _embed_object(dummy_request, path) == _embed(dummy_request, path)
+    assert _embed_object(dummy_request, '/testing-link-sources/@@object') is None
+    assert _embed_object(dummy_request, '/testing-link-sources/missing/@@object') is None
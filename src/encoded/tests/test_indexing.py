@@ -52,7 +52,9 @@ def teardown(app, dbapi_conn):
     from snowfort.elasticsearch import create_mapping
     create_mapping.run(app)
     cursor = dbapi_conn.cursor()
-    cursor.execute("""TRUNCATE resources, transactions CASCADE;""")
+    cursor.execute("""
+        TRUNCATE resources, transactions, dependencies, index_queue, search_cache CASCADE;
+    """)
     cursor.close()
 
 
@@ -99,12 +101,16 @@ def test_indexing_workbook(testapp, indexer_testapp):
     assert res.json['total'] > 5
 
 
-def test_indexing_simple(testapp, indexer_testapp):
+def test_indexing_simple(app, testapp, indexer_testapp):
+    from snowfort.elasticsearch import ELASTIC_SEARCH
     # First post a single item so that subsequent indexing is incremental
     testapp.post_json('/testing-post-put-patch/', {'required': ''})
     res = indexer_testapp.post_json('/index', {'record': True})
     assert res.json['indexed'] == 1
     assert 'txn_count' not in res.json
+    # The types filter of a full reindex is kept
+    assert res.json['types'] is None
+    assert 'testing_post_put_patch' in res.json['type_stats']
 
     res = testapp.post_json('/testing-post-put-patch/', {'required': ''})
     uuid = res.json['@graph'][0]['uuid']
@@ -112,8 +118,129 @@ def test_indexing_simple(testapp, indexer_testapp):
     assert res.json['indexed'] == 1
     assert res.json['txn_count'] == 1
     assert res.json['updated'] == [uuid]
+    type_stats = res.json['type_stats']['testing_post_put_patch']
+    assert type_stats['rendered'] == 1
+    assert type_stats['written'] == 1
+    assert type_stats['db_count'] > 0
     res = testapp.get('/search/?type=TestingPostPutPatch')
     assert res.json['total'] == 2
+    es = app.registry[ELASTIC_SEARCH]
+    status = es.get(index='encoded', doc_type='meta', id='indexing')
+    assert status['_source']['type_stats'] == {'testing_post_put_patch': type_stats}
+
+
+def test_indexing_skips_unchanged(testapp, indexer_testapp):
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['indexed'] == 1
+    assert res.json['skipped'] == 0
+
+    # Reindexing without any changes writes nothing
+    res = indexer_testapp.post_json('/index', {'record': True, 'last_xmin': None})
+    assert res.json['indexed'] == 1
+    assert res.json['skipped'] == 1
+
+
+def test_indexing_resume_checkpoint(app, testapp, indexer_testapp):
+    from snowfort.elasticsearch import ELASTIC_SEARCH
+    res = testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    done = res.json['@graph'][0]['uuid']
+    res = testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    remaining = res.json['@graph'][0]['uuid']
+    done, remaining = sorted([done, remaining])
+
+    # Simulate a reindex interrupted after the first item
+    es = app.registry[ELASTIC_SEARCH]
+    checkpoint = {
+        'xmin': 1,
+        'types': None,
+        'done': [],
+        'item_type': 'testing_post_put_patch',
+        'cursor': done,
+    }
+    es.index(index='encoded', doc_type='meta', body=checkpoint, id='reindex')
+
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['resumed']
+    assert res.json['xmin'] == 1
+    assert res.json['indexed'] == 1
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['last_xmin'] == 1
+
+
+def test_indexing_dependents(testapp, indexer_testapp):
+    target = {'name': 'one', 'uuid': '775795d3-4410-4114-836b-8eeecf1d0c2f'}
+    source = {
+        'name': 'A',
+        'target': target['uuid'],
+        'uuid': '16157204-8c8f-4672-a1a4-14f4b8021fcd',
+    }
+    testapp.post_json('/testing-link-targets/', target)
+    testapp.post_json('/testing-link-sources/', source)
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['indexed'] == 2
+
+    # The target embeds its reverse linked sources
+    testapp.patch_json('/testing-link-sources/' + source['uuid'], {'name': 'B'})
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['updated'] == [source['uuid']]
+    assert res.json['referencing'] == 2
+    assert res.json['indexed'] == 1
+    assert res.json['referencing_pending'] == 1
+    assert 'updated_lag' in res.json
+    res = testapp.get('/search/?type=TestingLinkTarget&frame=embedded')
+    assert res.json['@graph'][0]['reverse'][0]['name'] == 'A'
+
+    # Referencing documents are indexed by a later pass
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['txn_count'] == 0
+    assert res.json['referencing_pending'] == 1
+    res = indexer_testapp.post_json('/index', {'referencing': True})
+    assert res.json['indexed'] == 1
+    assert res.json['referencing_pending'] == 0
+    assert 'referencing_lag' in res.json
+    res = testapp.get('/search/?type=TestingLinkTarget&frame=embedded')
+    assert res.json['@graph'][0]['reverse'][0]['name'] == 'B'
+
+
+def test_indexing_dependencies_marker(app, testapp, indexer_testapp):
+    from snowfort.elasticsearch import ELASTIC_SEARCH
+    es = app.registry[ELASTIC_SEARCH]
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    res = indexer_testapp.post_json('/index', {'record': True})
+    marker = es.get(index='encoded', doc_type='meta', id='dependencies')
+    assert marker['_source']['xmin'] == res.json['xmin']
+
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['indexed'] == 1
+
+    # Without the marker everything is reindexed to record dependencies
+    es.delete(index='encoded', doc_type='meta', id='dependencies')
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    res = indexer_testapp.post_json('/index', {'record': True})
+    assert res.json['indexed'] == 3
+    assert es.exists(index='encoded', doc_type='meta', id='dependencies')
+
+
+def test_indexing_blue_green(app, testapp):
+    from snowfort.elasticsearch import ELASTIC_SEARCH
+    from snowfort.elasticsearch import create_mapping
+    es = app.registry[ELASTIC_SEARCH]
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    index = create_mapping.run_blue_green(app)
+    try:
+        assert create_mapping.aliased_indices(es, 'encoded') == [index]
+        res = testapp.get('/search/?type=TestingPostPutPatch')
+        assert res.json['total'] == 1
+
+        # A plain run recreates the index behind the alias
+        create_mapping.run(app)
+        assert create_mapping.aliased_indices(es, 'encoded') == [index]
+        res = testapp.get('/search/?type=TestingPostPutPatch', status=404)
+        assert res.json['total'] == 0
+    finally:
+        es.indices.delete(index=index)
 
 
 def test_listening(testapp, listening_conn):
@@ -125,3 +252,21 @@ def test_listening(testapp, listening_conn):
     notify = listening_conn.notifies.pop()
     assert notify.channel == 'snowfort.transaction'
     assert int(notify.payload) > 0
+
+
+def test_indexing_advances_generation(app, testapp, indexer_testapp):
+    from snowfort.elasticsearch import ELASTIC_SEARCH
+    from snowfort.elasticsearch.indexer import index_generation
+    es = app.registry[ELASTIC_SEARCH]
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    indexer_testapp.post_json('/index', {'record': True})
+    generation = index_generation(es, 'encoded')
+    assert generation is not None
+
+    # Nothing to index leaves cached searches valid
+    indexer_testapp.post_json('/index', {'record': True})
+    assert index_generation(es, 'encoded') == generation
+
+    testapp.post_json('/testing-post-put-patch/', {'required': ''})
+    indexer_testapp.post_json('/index', {'record': True})
+    assert index_generation(es, 'encoded') != generation
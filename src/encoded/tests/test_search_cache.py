@@ -0,0 +1,46 @@
+def test_search_cache_generation():
+    from encoded.search_cache import SearchCache
+    cache = SearchCache(1000)
+    assert cache.get('?type=Biosample', 'encoded/1') is None
+    cache.set('?type=Biosample', 'encoded/1', 200, '{"total": 1}')
+    assert cache.get('?type=Biosample', 'encoded/1') == (200, '{"total": 1}')
+    # Responses are not served once the index has moved on
+    assert cache.get('?type=Biosample', 'encoded/2') is None
+
+
+def test_search_cache_size():
+    from encoded.search_cache import SearchCache
+    cache = SearchCache(10)
+    cache.set('a', 'encoded/1', 200, '12345')
+    cache.set('b', 'encoded/1', 404, '12345')
+    cache.set('c', 'encoded/1', 200, '12345')
+    assert cache.get('a', 'encoded/1') is None
+    assert cache.get('b', 'encoded/1') == (404, '12345')
+    assert cache.get('c', 'encoded/1') == (200, '12345')
+
+
+class DummyES(object):
+    def __init__(self):
+        self.version = 1
+        self.gets = 0
+
+    def get(self, index, doc_type, id):
+        self.gets += 1
+        return {'_index': index, '_version': self.version, '_source': {'xmin': 10}}
+
+
+def test_search_cache_current_generation():
+    from encoded.search_cache import SearchCache
+    es = DummyES()
+    cache = SearchCache(1000, generation_interval=60)
+    generation = cache.current_generation(es, 'encoded')
+    es.version = 2
+    assert cache.current_generation(es, 'encoded') == generation
+    assert es.gets == 1
+
+    cache.generation_interval = 0
+    newer = cache.current_generation(es, 'encoded')
+    assert newer > generation
+    # A lagging read never moves the generation back
+    es.version = 1
+    assert cache.current_generation(es, 'encoded') == newer
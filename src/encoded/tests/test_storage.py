@@ -148,6 +148,188 @@ def test_keys(session):
         session.flush()
 
 
+def test_get_by_uuids(session, DBSession):
+    import uuid
+    from snowfort.storage import (
+        RDBStorage,
+        Resource,
+    )
+    resources = [Resource('test_item', {'': {'n': n}}) for n in range(3)]
+    session.add_all(resources)
+    session.flush()
+    storage = RDBStorage(DBSession)
+    rids = [str(resource.rid) for resource in resources]
+    models = storage.get_by_uuids(rids + [str(uuid.uuid4())])
+    assert {str(model.rid) for model in models} == set(rids)
+    assert sorted(model.properties['n'] for model in models) == [0, 1, 2]
+
+
+def test_iter_models(session, DBSession):
+    from snowfort.storage import (
+        Key,
+        RDBStorage,
+        Resource,
+    )
+    resources = [Resource('test_item', {'': {'n': n}}) for n in range(5)]
+    other = Resource('test_other', {'': {}})
+    session.add_all(resources + [other])
+    session.flush()
+    session.add(Key(rid=resources[0].rid, name='test_item:n', value='0'))
+    session.flush()
+    storage = RDBStorage(DBSession)
+    storage.batchsize = 2
+    models = list(storage.iter_models('test_item'))
+    assert {model.rid for model in models} == {resource.rid for resource in resources}
+    assert sorted(model.properties['n'] for model in models) == list(range(5))
+    assert [key.value for key in resources[0].unique_keys] == ['0']
+
+
+def test_get_rev_links(session, DBSession):
+    from snowfort.storage import (
+        Link,
+        RDBStorage,
+        Resource,
+    )
+    target = Resource('test_target', {'': {}})
+    source_a = Resource('test_source', {'': {}})
+    source_b = Resource('other_source', {'': {}})
+    session.add_all([target, source_a, source_b])
+    session.flush()
+    session.add_all([
+        Link(source_rid=source_a.rid, rel='target', target_rid=target.rid),
+        Link(source_rid=source_b.rid, rel='target', target_rid=target.rid),
+        Link(source_rid=source_b.rid, rel='other', target_rid=target.rid),
+    ])
+    session.flush()
+    storage = RDBStorage(DBSession)
+    assert set(storage.get_rev_links(target, 'target')) == {source_a.rid, source_b.rid}
+    assert storage.get_rev_links(target, 'target', 'test_source') == [source_a.rid]
+    assert storage.get_rev_links(target, 'other', 'test_source') == []
+
+
+def test_bulk_update(session, DBSession):
+    from snowfort.storage import (
+        Key,
+        RDBStorage,
+        Resource,
+    )
+    storage = RDBStorage(DBSession)
+    a = Resource('test_item', {'': {}})
+    b = Resource('test_item', {'': {}})
+    session.add_all([a, b])
+    session.flush()
+    session.add(Key(rid=a.rid, name='name', value='taken'))
+    session.flush()
+
+    new = storage.create('test_item', None)
+    changed, errors = storage.bulk_update([
+        (new, {'n': 1}, None, {'name': ['new']}, {'rel': [str(a.rid)]}),
+        (b, None, None, {'name': ['taken']}, None),
+    ])
+    assert changed == {str(new.rid)}
+    assert list(errors) == [str(b.rid)]
+    assert storage.get_by_uuid(str(new.rid)).properties == {'n': 1}
+    assert session.query(Key.rid).filter(Key.value == 'new').scalar() == new.rid
+    assert storage.get_rev_links(a, 'rel') == [new.rid]
+
+    # Keys may move between items in the same batch
+    changed, errors = storage.bulk_update([
+        (a, None, None, {'name': []}, None),
+        (b, None, None, {'name': ['taken']}, None),
+    ])
+    assert errors == {}
+    assert changed == {str(a.rid), str(b.rid)}
+    assert session.query(Key.rid).filter(Key.value == 'taken').scalar() == b.rid
+
+
+def test_model_cache(session):
+    from snowfort.storage import (
+        ModelCache,
+        Resource,
+    )
+    a = Resource('test_item', {'': {'name': 'a'}})
+    b = Resource('test_item', {'': {'name': 'b'}})
+    session.add_all([a, b])
+    session.flush()
+
+    cache = ModelCache(1000)
+    cache.xmin = 10
+    cached = cache.add(a, 10, ('name', 'a'))
+    assert cached.properties == {'name': 'a'}
+    assert cached.tid == a.tid
+    assert cache.get(a.rid, 10) is cached
+    assert cache.get_by_key(('name', 'a'), 11) is cached
+    # Not served to older snapshots
+    assert cache.get(a.rid, 9) is None
+    # Not stored when loaded from a snapshot older than the cache
+    cache.add(b, 9)
+    assert cache.get(b.rid, 10) is None
+
+    cache.max_size = cached.size
+    cache.add(b, 10)
+    assert cache.get(a.rid, 10) is None
+    assert cache.get_by_key(('name', 'a'), 10) is None
+    assert cache.get(b.rid, 10) is not None
+
+
+def test_model_cache_validate_interleaved_add(session):
+    import threading
+    import transaction
+    from snowfort.storage import (
+        ModelCache,
+        Resource,
+    )
+    a = Resource('test_item', {'': {'name': 'a'}})
+    session.add(a)
+    session.flush()
+
+    class Result(object):
+        def scalar(self):
+            return 20
+
+    class Connection(object):
+        def execute(self, statement):
+            return Result()
+
+    class Query(object):
+        def filter(self, *args):
+            # a was modified after the cache's xmin
+            return [({'updated': [str(a.rid)]},)]
+
+    class Session(object):
+        def connection(self):
+            return Connection()
+
+        def query(self, *args):
+            return Query()
+
+    class InterleavingLock(object):
+        """ Runs callbacks in between lock acquisitions.
+        """
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.callbacks = []
+
+        def __enter__(self):
+            self.lock.acquire()
+
+        def __exit__(self, *exc_info):
+            self.lock.release()
+            callbacks, self.callbacks = self.callbacks, []
+            for callback in callbacks:
+                callback()
+
+    cache = ModelCache(1000)
+    cache.xmin = 10
+    cache.lock = InterleavingLock()
+    # A slow transaction adds a from its older snapshot during validation
+    cache.lock.callbacks.append(lambda: cache.add(a, 10))
+    transaction.get()._extension.pop(ModelCache.xmin_key, None)
+    assert cache.validate(Session()) == 20
+    assert cache.xmin == 20
+    assert cache.get(a.rid, 20) is None
+
+
 def test_S3BlobStorage(mocker):
     from snowfort.storage import S3BlobStorage
     mocker.patch('boto.connect_s3')
@@ -190,3 +372,78 @@ def test_S3BlobStorage_get_blob_url_for_non_s3_file(mocker):
     storage.read_conn.generate_url.assert_called_once_with(
         129600, method='GET', bucket='test', key=download_meta['blob_id']
     )
+
+
+def test_read_replica_routing(session, dummy_request, threadlocals):
+    import transaction
+    from snowfort.storage import RDBStorage
+    primary = object()
+    storage = RDBStorage(lambda: primary, ReplicaDBSession=lambda: session)
+    data = transaction.get()._extension
+    assert storage.read_session() is session
+
+    # Replica has not yet caught up with the user's last edit
+    data.pop(RDBStorage.replica_key)
+    dummy_request.session['edits'] = [[2 ** 62, [], []]]
+    assert storage.read_session() is primary
+    data.pop(RDBStorage.replica_key)
+    dummy_request.session['edits'] = [[1, [], []]]
+    assert storage.read_session() is session
+
+
+def test_s3_blob_range():
+    import boto
+    from moto import mock_s3
+    from snowfort.storage import S3BlobStorage
+    data = bytes(bytearray(range(256))) * 10
+    with mock_s3():
+        boto.connect_s3().create_bucket('test')
+        storage = S3BlobStorage('test', redirect=False)
+        download_meta = {'download': 'test.bin'}
+        storage.store_blob(data, download_meta)
+
+        blob = storage.open_blob(download_meta)
+        blob.chunk_size = 100
+        assert blob.size == len(data)
+        assert b''.join(blob) == data
+        assert b''.join(blob.app_iter_range(1000, 1500)) == data[1000:1500]
+        assert b''.join(blob.app_iter_range(2500, None)) == data[2500:]
+
+        assert storage.open_blob({'bucket': 'test', 'key': 'missing'}) is None
+
+
+def test_rdb_blob_missing_chunk():
+    import pytest
+    from snowfort.storage import RDBBlob
+
+    class Result(object):
+        def scalar(self):
+            return None
+
+    class Connection(object):
+        def execute(self, query, **params):
+            return Result()
+
+        def close(self):
+            pass
+
+    class Bind(object):
+        def connect(self):
+            return Connection()
+
+    blob = RDBBlob(Bind(), 'blob_id', 10)
+    with pytest.raises(IOError):
+        list(blob)
+
+
+def test_upgrade_schema(external_tx, connection):
+    from sqlalchemy import inspect
+    from snowfort.schema_upgrade import upgrade_schema
+    connection.execute('DROP INDEX ix_transactions_xid')
+    connection.execute('ALTER TABLE index_queue DROP COLUMN attempts')
+    upgrade_schema(connection)
+    inspector = inspect(connection)
+    assert 'attempts' in {c['name'] for c in inspector.get_columns('index_queue')}
+    assert 'ix_transactions_xid' in {i['name'] for i in inspector.get_indexes('transactions')}
+    # Nothing left to do
+    upgrade_schema(connection)
@@ -9,6 +9,7 @@ from snowfort import (
     collection,
     load_schema,
 )
+from snowfort.embed import thaw
 from snowfort.resource_views import item_view_page
 from .base import (
     ALLOW_EVERYONE_VIEW,
@@ -123,6 +124,8 @@ def page_view_page(context, request):
     # Embedding of items has to happen here as we don't know which of their subobjects
     # need embedding as we don't know the type and may need their full page view.
     properties = item_view_page(context, request)
+    if 'layout' in properties:
+        properties['layout'] = thaw(properties['layout'])
     blocks = properties.get('layout', {}).get('blocks', [])
     for block in blocks:
         if 'item' in block and block['item']:
@@ -94,7 +94,7 @@ def user_page_view(context, request):
         properties = item_view_object(context, request)
     else:
         item_path = request.resource_path(context)
-        properties = request.embed(item_path, '@@object')
+        properties = request.embed(item_path, '@@object').copy()
     for path in context.embedded:
         expand_path(request, properties, path)
     calculated = calculate_properties(context, request, properties, category='page')
@@ -5,6 +5,7 @@ from mimetypes import guess_type
 from PIL import Image
 from pyramid.httpexceptions import (
     HTTPNotFound,
+    HTTPNotModified,
 )
 from pyramid.response import Response
 from pyramid.traversal import find_root
@@ -200,13 +201,27 @@ def download(context, request):
 
     # If blob is external, serve via proxy using X-Accel-Redirect
     blob_storage = request.registry[BLOBS]
-    if hasattr(blob_storage, 'get_blob_url'):
+    if getattr(blob_storage, 'redirect', False):
         blob_url = blob_storage.get_blob_url(download_meta)
         return Response(headers={'X-Accel-Redirect': '/_proxy/' + str(blob_url)})
 
-    # Otherwise serve the blob data ourselves
-    blob = request.registry[BLOBS].get_blob(download_meta)
+    # Otherwise stream the blob data ourselves
+    etag = download_meta.get('md5sum')
+    if etag is not None and etag in request.if_none_match:
+        # A 304 must carry the ETag a 200 would have had
+        raise HTTPNotModified(etag=etag)
+
+    blob = blob_storage.open_blob(download_meta)
+    if blob is None:
+        raise HTTPNotFound(filename)
     headers = {
         'Content-Type': mimetype,
     }
-    return Response(body=blob, headers=headers)
+    # conditional_response lets webob answer Range requests using the
+    # blob's app_iter_range.
+    response = Response(app_iter=blob, headers=headers, conditional_response=True)
+    response.content_length = blob.size
+    response.accept_ranges = 'bytes'
+    if etag is not None:
+        response.etag = etag
+    return response
@@ -61,73 +61,99 @@ def worker(batch):
     return res.json
 
 
-def update_item(storage, context):
+def upgrade_item(context):
+    """ Upgrade and validate the properties of an item that needs it.
+
+    Returns ``(None, [])`` when the item is already at the target version.
+    """
     target_version = context.type_info.schema_version
     current_version = context.properties.get('schema_version', '')
-    update = False
-    errors = []
-    properties = context.properties
     if target_version is None or current_version == target_version:
-        unique_keys = context.unique_keys(properties)
-        links = context.links(properties)
-        keys_add, keys_remove = storage._update_keys(context.model, unique_keys)
-        if keys_add or keys_remove:
-            update = True
-        rels_add, rels_remove = storage._update_rels(context.model, links)
-        if rels_add or rels_remove:
-            update = True
-    else:
-        properties = deepcopy(properties)
-        upgrader = context.registry[UPGRADER]
-        properties = upgrader.upgrade(
-            context.type_info.name, properties, current_version, target_version,
-            context=context, registry=context.registry)
-        if 'schema_version' in properties:
-            del properties['schema_version']
-        schema = context.type_info.schema
-        properties['uuid'] = str(context.uuid)
-        validated, errors = validate(schema, properties, properties)
-        # Do not send modification events to skip indexing
-        context.update(validated)
-        update = True
-    return update, errors
+        return None, []
+    properties = deepcopy(context.properties)
+    upgrader = context.registry[UPGRADER]
+    properties = upgrader.upgrade(
+        context.type_info.name, properties, current_version, target_version,
+        context=context, registry=context.registry)
+    if 'schema_version' in properties:
+        del properties['schema_version']
+    schema = context.type_info.schema
+    properties['uuid'] = str(context.uuid)
+    validated, errors = validate(schema, properties, properties)
+    return validated, errors
+
+
+def log_validation_errors(item_type, uuid, errors):
+    errortext = [
+        '%s: %s' % ('/'.join(error.path) or '<root>', error.message)
+        for error in errors]
+    logger.error(
+        'Validation failure: /%s/%s\n%s', item_type, uuid, '\n'.join(errortext))
 
 
 @view_config(route_name='batch_upgrade', request_method='POST', permission='import_items')
 def batch_upgrade(request):
+    """ Upgrade items and refresh their keys and links.
+
+    Items already at the current schema version only need their keys and
+    links recalculated, which is done for the whole batch with a single
+    ``bulk_update``. Upgraded items go through ``Item.update`` in a savepoint
+    so type specific update logic still applies.
+    """
     request.datastore = 'database'
     transaction.get().setExtendedInfo('upgrade', True)
     batch = request.json['batch']
     root = request.root
-    storage = request.registry[STORAGE].write
-    session = storage.DBSession()
-    results = []
+    connection = request.registry[CONNECTION]
+    session = request.registry[STORAGE].write.DBSession()
+    results = {}
+    bulk = []
+    # Load the whole batch into the item cache with one query.
+    connection.get_by_uuids(batch)
     for uuid in batch:
         item_type = None
-        update = False
-        error = False
-        sp = session.begin_nested()
         try:
             item = find_resource(root, uuid)
             item_type = item.type_info.item_type
-            update, errors = update_item(storage, item)
+            validated, errors = upgrade_item(item)
+            if validated is None:
+                properties = item.properties
+                bulk.append((item_type, uuid, item.model, item.unique_keys(properties),
+                             item.links(properties)))
+                continue
+        except Exception:
+            logger.exception('Error updating: /%s/%s', item_type, uuid)
+            results[uuid] = (item_type, uuid, False, True)
+            continue
+
+        if errors:
+            log_validation_errors(item_type, uuid, errors)
+            results[uuid] = (item_type, uuid, False, True)
+            continue
+
+        sp = session.begin_nested()
+        try:
+            # Do not send modification events to skip indexing
+            item.update(validated)
         except Exception:
             logger.exception('Error updating: /%s/%s', item_type, uuid)
             sp.rollback()
-            error = True
+            results[uuid] = (item_type, uuid, False, True)
         else:
-            if errors:
-                errortext = [
-                    '%s: %s' % ('/'.join(error.path) or '<root>', error.message)
-                    for error in errors]
-                logger.error(
-                    'Validation failure: /%s/%s\n%s', item_type, uuid, '\n'.join(errortext))
-                sp.rollback()
-                error = True
-            else:
-                sp.commit()
-        results.append((item_type, uuid, update, error))
-    return {'results': results}
+            sp.commit()
+            results[uuid] = (item_type, uuid, True, False)
+
+    changed, conflicts = connection.bulk_update(
+        (model, None, None, unique_keys, links)
+        for item_type, uuid, model, unique_keys, links in bulk
+    )
+    for item_type, uuid, model, unique_keys, links in bulk:
+        rid = str(model.uuid)
+        if rid in conflicts:
+            logger.error('Error updating: /%s/%s: %s', item_type, uuid, conflicts[rid])
+        results[uuid] = (item_type, uuid, rid in changed, rid in conflicts)
+
+    return {'results': [results[uuid] for uuid in batch]}
 
 
 def run(config_uri, app_name=None, username=None, types=(), batch_size=500, processes=None):
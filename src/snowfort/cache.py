@@ -1,15 +1,71 @@
+from collections import OrderedDict
 from pyramid.threadlocal import manager
 from sqlalchemy.util import LRUCache
+import humanfriendly
+import sys
 import transaction.interfaces
 from zope.interface import implementer
 
 
+def approximate_size(value):
+    """ Rough size in bytes of a json like structure.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approximate_size(k) + approximate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += approximate_size(v)
+    return size
+
+
+class SizedLRUCache(object):
+    """ LRU cache limited by the approximate total size of its values.
+    """
+    def __init__(self, max_size, sizeof=approximate_size):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.data = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        value, size = self.data.pop(key)
+        self.data[key] = (value, size)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.data:
+            self.size -= self.data.pop(key)[1]
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        self.data[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            key, (value, size) = self.data.popitem(last=False)
+            self.size -= size
+
+
 @implementer(transaction.interfaces.ISynchronizer)
 class ManagerLRUCache(object):
     """ Override capacity in settings.
+
+    Setting ``<name>.size`` (e.g. ``100MB``) limits the cache by the
+    approximate size of its values instead of the number of entries.
+
+    Hits, misses, evictions and values rejected as too big are counted in
+    the request's stats.
     """
     def __init__(self, name, default_capacity=100, threshold=.5):
         self.name = name
+        self.stats_prefix = name.rsplit('.', 1)[-1] + '_'
         self.default_capacity = default_capacity
         self.threshold = threshold
         transaction.manager.registerSynch(self)
@@ -21,18 +77,34 @@ class ManagerLRUCache(object):
         threadlocals = manager.stack[0]
         if self.name not in threadlocals:
             registry = threadlocals['registry']
-            capacity = int(registry.settings.get(self.name + '.capacity', self.default_capacity))
-            threadlocals[self.name] = LRUCache(capacity, self.threshold)
+            size = registry.settings.get(self.name + '.size')
+            if size:
+                threadlocals[self.name] = SizedLRUCache(humanfriendly.parse_size(size))
+            else:
+                capacity = int(registry.settings.get(
+                    self.name + '.capacity', self.default_capacity))
+                threadlocals[self.name] = LRUCache(capacity, self.threshold)
         return threadlocals[self.name]
 
+    def _count(self, name, count=1):
+        request = manager.stack[0].get('request')
+        stats = getattr(request, '_stats', None)
+        if stats is None:
+            return
+        key = self.stats_prefix + name
+        stats[key] = stats.get(key, 0) + count
+
     def get(self, key, default=None):
         cache = self.cache
         if cache is None:
             return default
         try:
-            return cache[key]
+            value = cache[key]
         except KeyError:
+            self._count('misses')
             return default
+        self._count('hits')
+        return value
 
     def __contains__(self, key):
         cache = self.cache
@@ -44,7 +116,19 @@ class ManagerLRUCache(object):
         cache = self.cache
         if cache is None:
             return
-        self.cache[key] = value
+        before = len(cache) + (key not in cache)
+        cache[key] = value
+        evicted = before - len(cache)
+        if key not in cache:
+            # Bigger than the whole cache so never stored
+            self._count('rejected')
+            evicted -= 1
+        if evicted:
+            self._count('evictions', evicted)
+
+    def clear(self):
+        if manager.stack:
+            manager.stack[0].pop(self.name, None)
 
     # ISynchronizer
 
@@ -3,7 +3,10 @@ import venusian
 from pyramid.decorator import reify
 from pyramid.traversal import find_root
 from types import MethodType
-from .interfaces import CALCULATED_PROPERTIES
+from .interfaces import (
+    CALCULATED_PROPERTIES,
+    CONNECTION,
+)
 
 
 def includeme(config):
@@ -43,6 +46,7 @@ class ItemNamespace(object):
             value = self._properties[name]
             if name in context.type_info.schema_links:
                 if isinstance(value, list):
+                    self.registry[CONNECTION].get_by_uuids(value)
                     value = [
                         request.resource_path(self.root.get_by_uuid(v))
                         for v in value
@@ -53,6 +57,7 @@ class ItemNamespace(object):
             return value
         if name in context.rev:
             value = context.get_rev_links(name)
+            self.registry[CONNECTION].get_by_uuids(value)
             value = [
                 request.resource_path(self.root.get_by_uuid(v))
                 for v in value
@@ -25,6 +25,8 @@ class Connection(object):
         self.registry = registry
         self.item_cache = ManagerLRUCache('snowfort.connection.item_cache', 1000)
         self.unique_key_cache = ManagerLRUCache('snowfort.connection.key_cache', 1000)
+        # Lookups known to find nothing, cleared on any write.
+        self.miss_cache = ManagerLRUCache('snowfort.connection.miss_cache', 1000)
 
     @reify
     def storage(self):
@@ -48,19 +50,49 @@ class Connection(object):
         if cached is not None:
             return cached
 
+        if uuid in self.miss_cache:
+            return default
+
         model = self.storage.get_by_uuid(uuid)
         if model is None:
+            self.miss_cache[uuid] = True
             return default
 
-        try:
-            Item = self.types.by_item_type[model.item_type].factory
-        except KeyError:
-            raise UnknownItemTypeError(model.item_type)
-
-        item = Item(self.registry, model)
-        model.used_for(item)
-        self.item_cache[uuid] = item
-        return item
+        return self._add_to_cache(model)
+
+    def get_by_uuids(self, uuids):
+        ''' Prefetch many items into the item cache with one storage query.
+
+        Returns the items found, in the order requested.
+        '''
+        wanted = []
+        for uuid in uuids:
+            if isinstance(uuid, basestring):
+                try:
+                    uuid = UUID(uuid)
+                except ValueError:
+                    continue
+            elif not isinstance(uuid, UUID):
+                raise TypeError(uuid)
+            wanted.append(str(uuid))
+
+        items = {}
+        missing = set()
+        for uuid in wanted:
+            cached = self.item_cache.get(uuid)
+            if cached is not None:
+                items[uuid] = cached
+            elif uuid not in self.miss_cache:
+                missing.add(uuid)
+
+        if missing:
+            for model in self.storage.get_by_uuids(sorted(missing)):
+                item = self._add_to_cache(model)
+                items[str(model.uuid)] = item
+            for uuid in missing.difference(items):
+                self.miss_cache[uuid] = True
+
+        return [items[uuid] for uuid in wanted if uuid in items]
 
     def get_by_unique_key(self, unique_key, name, default=None):
         pkey = (unique_key, name)
@@ -69,16 +101,23 @@ class Connection(object):
         if cached is not None:
             return self.get_by_uuid(cached)
 
+        if pkey in self.miss_cache:
+            return default
+
         model = self.storage.get_by_unique_key(unique_key, name)
         if model is None:
+            self.miss_cache[pkey] = True
             return default
 
-        uuid = model.uuid
+        uuid = str(model.uuid)
         self.unique_key_cache[pkey] = uuid
         cached = self.item_cache.get(uuid)
         if cached is not None:
             return cached
 
+        return self._add_to_cache(model)
+
+    def _add_to_cache(self, model):
         try:
             Item = self.types.by_item_type[model.item_type].factory
         except KeyError:
@@ -86,7 +125,7 @@ class Connection(object):
 
         item = Item(self.registry, model)
         model.used_for(item)
-        self.item_cache[uuid] = item
+        self.item_cache[str(model.uuid)] = item
         return item
 
     def get_rev_links(self, model, rel, *types):
@@ -101,6 +140,16 @@ class Connection(object):
         for uuid in self.storage.__iter__(*item_types):
             yield uuid
 
+    def iter_items(self, *types):
+        ''' Stream items from storage in batches, for full passes.
+        '''
+        if not types:
+            item_types = self.types.by_item_type.keys()
+        else:
+            item_types = [self.types[t].item_type for t in types]
+        for model in self.storage.iter_models(*item_types):
+            yield self._add_to_cache(model)
+
     def __len__(self, *types):
         if not types:
             item_types = self.types.by_item_type.keys()
@@ -116,7 +165,13 @@ class Connection(object):
 
     def create(self, type_, uuid):
         ti = self.types[type_]
+        self.miss_cache.clear()
         return self.storage.create(ti.item_type, uuid)
 
     def update(self, model, properties, sheets=None, unique_keys=None, links=None):
+        self.miss_cache.clear()
         self.storage.update(model, properties, sheets, unique_keys, links)
+
+    def bulk_update(self, updates):
+        self.miss_cache.clear()
+        return self.storage.bulk_update(updates)
@@ -37,7 +37,10 @@ def includeme(config):
 
     config.include('.indexer')
     if asbool(settings.get('indexer')) and not PY2:
-        config.include('.mpindexer')
+        if asbool(settings.get('indexer.queue')):
+            config.include('.queueindexer')
+        else:
+            config.include('.mpindexer')
 
 
 def datastore(request):
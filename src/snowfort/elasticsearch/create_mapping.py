@@ -5,9 +5,14 @@ To load the initial data:
 
     %(prog)s production.ini
 
+To build a fresh versioned index, fill it and swap the alias to it:
+
+    %(prog)s --blue-green production.ini
+
 """
 from pyramid.paster import get_app
 from elasticsearch import RequestError
+from webtest import TestApp
 from functools import reduce
 from snowfort import (
     COLLECTIONS,
@@ -16,6 +21,7 @@ from snowfort import (
 from snowfort.schema_utils import combine_schemas
 from .interfaces import ELASTIC_SEARCH
 import collections
+import datetime
 import json
 import logging
 
@@ -268,6 +274,11 @@ def es_mapping(mapping):
                 'type': 'string',
                 'index': 'not_analyzed'
             },
+            'index_hash': {
+                'type': 'string',
+                'index': 'no',
+                'include_in_all': False,
+            },
             'embedded': mapping,
             'object': {
                 'type': 'object',
@@ -420,18 +431,32 @@ def type_mapping(types, item_type, embed=True):
     return mapping
 
 
-def run(app, collections=None, dry_run=False):
+def run(app, collections=None, dry_run=False, blue_green=False):
+    if blue_green and not dry_run:
+        return run_blue_green(app)
     index = app.registry.settings['snowfort.elasticsearch.index']
-    registry = app.registry
     if not dry_run:
         es = app.registry[ELASTIC_SEARCH]
+        body = index_settings()
+        indices = aliased_indices(es, index)
+        if len(indices) > 1:
+            raise ValueError('Alias %s points at several indices: %s' % (index, ', '.join(indices)))
+        if indices:
+            # After a blue/green switch recreate the index the alias points
+            # at, rather than deleting it through the alias.
+            body = {'settings': body, 'aliases': {index: {}}}
+            index = indices[0]
         try:
-            es.indices.create(index=index, body=index_settings())
+            es.indices.create(index=index, body=body)
         except RequestError:
             if collections is None:
                 es.indices.delete(index=index)
-                es.indices.create(index=index, body=index_settings())
+                es.indices.create(index=index, body=body)
+    create_mappings(app.registry, index, collections, dry_run)
 
+
+def create_mappings(registry, index, collections=None, dry_run=False):
+    es = registry[ELASTIC_SEARCH]
     if not collections:
         collections = ['meta'] + list(registry[COLLECTIONS].by_item_type.keys())
 
@@ -461,6 +486,64 @@ def run(app, collections=None, dry_run=False):
             es.indices.refresh(index=index)
 
 
+def run_blue_green(app, username='INDEXER'):
+    """ Build a versioned index alongside the live one and swap the alias to it.
+
+    The new index is filled with a full reindex from a consistent snapshot,
+    then caught up from the xmin it recorded before the alias is moved.
+    Previous indices are kept for rollback with swap_alias.
+    """
+    registry = app.registry
+    es = registry[ELASTIC_SEARCH]
+    alias = registry.settings['snowfort.elasticsearch.index']
+    index = '%s_%s' % (alias, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+    log.info('Creating index %s', index)
+    es.indices.create(index=index, body=index_settings())
+    create_mappings(registry, index)
+
+    testapp = TestApp(app, {
+        'HTTP_ACCEPT': 'application/json',
+        'REMOTE_USER': username,
+    })
+    res = testapp.post_json('/index', {'record': True, 'index': index})
+    log.info('Indexed %d items into %s', res.json.get('indexed', 0), index)
+    # Catch up with transactions committed during the full reindex.
+    res = testapp.post_json('/index', {'record': True, 'index': index})
+    log.info('Caught up %d items into %s', res.json.get('indexed', 0), index)
+
+    swap_alias(es, alias, index)
+    return index
+
+
+def aliased_indices(es, alias):
+    """ The indices alias points at.
+
+    ES 1.x returns every index from get_aliases, with empty aliases for
+    those without it.
+    """
+    return sorted(
+        index for index, info in es.indices.get_aliases(name=alias).items()
+        if alias in info.get('aliases', {})
+    )
+
+
+def swap_alias(es, alias, index):
+    """ Atomically point alias at index.
+    """
+    actions = [
+        {'remove': {'index': old_index, 'alias': alias}}
+        for old_index in aliased_indices(es, alias)
+    ]
+    if not actions and es.indices.exists(index=alias):
+        # Upgrading from an unversioned index, which must go before an
+        # alias can take its name.
+        log.warning('Deleting unversioned index %s', alias)
+        es.indices.delete(index=alias)
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+    log.info('Alias %s now points at %s', alias, index)
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(
@@ -471,6 +554,9 @@ def main():
     parser.add_argument('--app-name', help="Pyramid app name in configfile")
     parser.add_argument(
         '--dry-run', action='store_true', help="Don't post to ES, just print")
+    parser.add_argument(
+        '--blue-green', action='store_true',
+        help="Build and index a new versioned index, then swap the alias to it")
     parser.add_argument('config_uri', help="path to configfile")
     args = parser.parse_args()
 
@@ -480,7 +566,7 @@ def main():
     # Loading app will have configured from config file. Reconfigure here:
     logging.getLogger('encoded').setLevel(logging.DEBUG)
 
-    return run(app, args.item_type, args.dry_run)
+    return run(app, args.item_type, args.dry_run, args.blue_green)
 
 
 if __name__ == '__main__':
@@ -88,6 +88,18 @@ class PickStorage(object):
                 return self.write.get_by_uuid(uuid)
         return model
 
+    def get_by_uuids(self, uuids):
+        uuids = [str(uuid) for uuid in uuids]
+        storage = self.storage()
+        models = storage.get_by_uuids(uuids)
+        if storage is self.read:
+            models = [model for model in models if not model.invalidated()]
+            found = {str(model.uuid) for model in models}
+            missing = [uuid for uuid in uuids if uuid not in found]
+            if missing:
+                models.extend(self.write.get_by_uuids(missing))
+        return models
+
     def get_by_unique_key(self, unique_key, name):
         storage = self.storage()
         model = storage.get_by_unique_key(unique_key, name)
@@ -105,12 +117,18 @@ class PickStorage(object):
     def __len__(self, *item_types):
         return self.storage().__len__(*item_types)
 
+    def iter_models(self, *item_types):
+        return self.write.iter_models(*item_types)
+
     def create(self, item_type, uuid):
         return self.write.create(item_type, uuid)
 
     def update(self, model, properties=None, sheets=None, unique_keys=None, links=None):
         return self.write.update(model, properties, sheets, unique_keys, links)
 
+    def bulk_update(self, updates):
+        return self.write.bulk_update(updates)
+
 
 class ElasticSearchStorage(object):
     writeable = False
@@ -134,6 +152,13 @@ class ElasticSearchStorage(object):
             return None
         return CachedModel(hit)
 
+    def get_by_uuids(self, uuids):
+        ids = [str(uuid) for uuid in uuids]
+        if not ids:
+            return []
+        data = self.es.mget(index=self.index, body={'ids': ids})
+        return [CachedModel(doc) for doc in data['docs'] if doc.get('found')]
+
     def get_by_unique_key(self, unique_key, name):
         term = 'unique_keys.' + unique_key
         query = {
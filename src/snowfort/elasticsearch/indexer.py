@@ -1,13 +1,26 @@
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
 from elasticsearch.exceptions import (
     ConflictError,
     ConnectionError,
     NotFoundError,
     TransportError,
 )
+from pyramid.settings import asbool
 from pyramid.view import view_config
+from queue import Queue
+from sqlalchemy import (
+    and_,
+    or_,
+    select,
+    text,
+)
 from sqlalchemy.exc import StatementError
 from snowfort import DBSESSION
 from snowfort.storage import (
+    Dependency,
     TransactionRecord,
 )
 from urllib3.exceptions import ReadTimeoutError
@@ -16,13 +29,31 @@ from .interfaces import (
     INDEXER,
 )
 import datetime
+import hashlib
+import humanfriendly
+import json
 import logging
 import pytz
+import threading
 import time
 
 
 log = logging.getLogger(__name__)
-SEARCH_MAX = 99999  # OutOfMemoryError if too high
+
+# Writers of an item's dependencies hold a transaction level advisory lock
+# keyed on (DEPENDENCY_LOCK_NAMESPACE, hashtext(uuid)), taken in uuid order
+# to avoid deadlocks.
+DEPENDENCY_LOCK_NAMESPACE = 1902
+LOCK_DEPENDENCIES = text(
+    "SELECT pg_advisory_xact_lock(:namespace, hashtext(uuid)) "
+    "FROM (SELECT unnest(CAST(:uuids AS text[])) AS uuid ORDER BY 1) AS ordered"
+)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+Document = namedtuple('Document', [
+    'uuid', 'item_type', 'source', 'embedded_uuids', 'linked_uuids', 'index_hash',
+])
 
 
 def includeme(config):
@@ -34,7 +65,8 @@ def includeme(config):
 
 @view_config(route_name='index', request_method='POST', permission="index")
 def index(request):
-    INDEX = request.registry.settings['snowfort.elasticsearch.index']
+    # Blue/green builds index into a new versioned index before swapping the alias.
+    INDEX = request.json.get('index') or request.registry.settings['snowfort.elasticsearch.index']
     # Setting request.datastore here only works because routed views are not traversed.
     request.datastore = 'database'
     record = request.json.get('record', False)
@@ -60,6 +92,9 @@ def index(request):
     # which is not available in recovery.
     xmin = query.scalar()  # lowest xid that is still in progress
 
+    if request.json.get('referencing', False):
+        return index_referencing(request, connection, es, INDEX, xmin, recovery, dry_run)
+
     first_txn = None
     last_xmin = None
     if 'last_xmin' in request.json:
@@ -78,9 +113,16 @@ def index(request):
     }
 
     flush = False
+    checkpoint = None
     if last_xmin is None:
         result['types'] = types = request.json.get('types', None)
-        invalidated = list(all_uuids(request.root, types))
+        if record and not dry_run:
+            # Continue an interrupted full reindex from its checkpoint.
+            checkpoint = reindex_checkpoint(es, INDEX, xmin, types)
+            result['xmin'] = checkpoint['xmin']
+            result['resumed'] = bool(checkpoint['done'] or checkpoint['cursor'])
+        plan = reindex_plan(request.root, types, checkpoint)
+        invalidated = [uuid for item_type, uuids in plan for uuid in uuids]
         flush = True
     else:
         txns = session.query(TransactionRecord).filter(
@@ -104,33 +146,16 @@ def index(request):
 
         result['txn_count'] = txn_count
         if txn_count == 0:
+            result['referencing_pending'] = len(update_referencing(es, INDEX)['uuids'])
             return result
 
-        es.indices.refresh(index=INDEX)
-        res = es.search(index=INDEX, size=SEARCH_MAX, body={
-            'filter': {
-                'or': [
-                    {
-                        'terms': {
-                            'embedded_uuids': updated,
-                            '_cache': False,
-                        },
-                    },
-                    {
-                        'terms': {
-                            'linked_uuids': renamed,
-                            '_cache': False,
-                        },
-                    },
-                ],
-            },
-            '_source': False,
-        })
-        if res['hits']['total'] > SEARCH_MAX:
-            invalidated = list(all_uuids(request.root))
+        if not dependencies_recorded(es, INDEX):
+            # Dependencies are recorded at index time so reindex everything once.
+            plan = reindex_plan(request.root)
+            invalidated = [uuid for item_type, uuids in plan for uuid in uuids]
             flush = True
         else:
-            referencing = {hit['_id'] for hit in res['hits']['hits']}
+            referencing = dependents(session, updated, renamed)
             invalidated = referencing | updated
             result.update(
                 max_xid=max_xid,
@@ -142,7 +167,8 @@ def index(request):
                 first_txn_timestamp=first_txn.isoformat(),
             )
 
-    if invalidated and not dry_run:
+    # A resumed reindex may have nothing left but still needs recording.
+    if (invalidated or result.get('resumed')) and not dry_run:
         # Exporting a snapshot mints a new xid, so only do so when required.
         # Not yet possible to export a snapshot on a standby server:
         # http://www.postgresql.org/message-id/CAHGQGwEtJCeHUB6KzaiJ6ndvx6EFsidTGnuLwJ1itwVH0EJTOA@mail.gmail.com
@@ -150,12 +176,54 @@ def index(request):
         if not recovery:
             snapshot_id = connection.execute('SELECT pg_export_snapshot();').scalar()
 
-        result['errors'] = indexer.update_objects(request, invalidated, xmin, snapshot_id)
+        settings = request.registry.settings
+        stats = {}
+        errors = []
+        if flush:
+            chunk = int(settings.get('indexer.checkpoint_chunk', 5000))
+            for item_type, uuids in plan:
+                for start in range(0, len(uuids), chunk):
+                    batch = uuids[start:start + chunk]
+                    errors.extend(indexer.update_objects(
+                        request, batch, xmin, snapshot_id, INDEX, stats))
+                    if checkpoint is not None:
+                        checkpoint.update(item_type=item_type, cursor=batch[-1])
+                        es.index(index=INDEX, doc_type='meta', body=checkpoint, id='reindex')
+                if checkpoint is not None:
+                    checkpoint['done'].append(item_type)
+                    checkpoint.update(item_type=None, cursor=None)
+                    es.index(index=INDEX, doc_type='meta', body=checkpoint, id='reindex')
+        else:
+            # Only direct edits are indexed now so they are searchable before
+            # the (possibly many) documents which embed them. Those are left
+            # to later referencing passes, each in its own transaction.
+            errors.extend(indexer.update_objects(
+                request, sorted(updated), xmin, snapshot_id, INDEX, stats))
+            result['updated_lag'] = str(datetime.datetime.now(pytz.utc) - first_txn)
+            pending = update_referencing(
+                es, INDEX, add=invalidated - updated, since=timestamp(first_txn))
+            result['referencing_pending'] = len(pending['uuids'])
+            invalidated = updated
+
+        result['errors'] = errors
         result['indexed'] = len(invalidated)
+        result['skipped'] = stats.get('skipped', 0)
+        result['type_stats'] = {
+            item_type: {key: value for key, value in type_stats.items() if key != 'render_times'}
+            for item_type, type_stats in stats.get('types', {}).items()
+        }
         if record:
             es.index(index=INDEX, doc_type='meta', body=result, id='indexing')
+        if flush and not result.get('types'):
+            # Every item now has its dependencies recorded.
+            es.index(index=INDEX, doc_type='meta', body={'xmin': xmin}, id='dependencies')
+            try:
+                es.delete(index=INDEX, doc_type='meta', id='referencing')
+            except NotFoundError:
+                pass
 
         es.indices.refresh(index=INDEX)
+        advance_generation(es, INDEX, xmin)
 
         if flush:
             try:
@@ -163,48 +231,330 @@ def index(request):
             except ConflictError:
                 pass
 
+        if checkpoint is not None:
+            try:
+                es.delete(index=INDEX, doc_type='meta', id='reindex')
+            except NotFoundError:
+                pass
+
     if first_txn is not None:
         result['lag'] = str(datetime.datetime.now(pytz.utc) - first_txn)
 
     return result
 
 
-def all_uuids(root, types=None):
+def index_referencing(request, connection, es, index, xmin, recovery=False, dry_run=False):
+    """ Index the next chunk of referencing documents left by earlier passes.
+    """
+    result = {
+        'xmin': xmin,
+        'referencing': True,
+        'indexed': 0,
+    }
+    pending = update_referencing(es, index)
+    chunk = int(request.registry.settings.get('indexer.referencing_chunk', 1000))
+    batch = sorted(pending['uuids'])[:chunk]
+    if not batch or dry_run:
+        result['referencing_pending'] = len(pending['uuids'])
+        return result
+
+    snapshot_id = None
+    if not recovery:
+        snapshot_id = connection.execute('SELECT pg_export_snapshot();').scalar()
+    stats = {}
+    # Failed documents are reported rather than retried.
+    result['errors'] = request.registry[INDEXER].update_objects(
+        request, batch, xmin, snapshot_id, index, stats)
+    result['indexed'] = len(batch)
+    result['skipped'] = stats.get('skipped', 0)
+    pending = update_referencing(es, index, remove=batch)
+    result['referencing_pending'] = len(pending['uuids'])
+    if not pending['uuids']:
+        result['referencing_lag'] = str(datetime.timedelta(seconds=time.time() - pending['since']))
+
+    es.indices.refresh(index=index)
+    advance_generation(es, index, xmin)
+    return result
+
+
+def update_referencing(es, index, add=(), remove=(), since=None):
+    """ Update the referencing documents still to be indexed.
+
+    Stored as ``{'uuids': [...], 'since': timestamp}`` in a meta document,
+    where since is when the oldest of them was invalidated. Returns the
+    pending documents after adding and removing uuids.
+    """
+    while True:
+        try:
+            doc = es.get(index=index, doc_type='meta', id='referencing')
+        except NotFoundError:
+            pending, version = {'uuids': [], 'since': None}, None
+        else:
+            pending, version = doc['_source'], doc['_version']
+        if not add and not remove:
+            return pending
+        uuids = (set(pending['uuids']) | set(add)) - set(remove)
+        if add and since is not None:
+            since = since if pending['since'] is None else min(since, pending['since'])
+        else:
+            since = pending['since']
+        updated = {'uuids': sorted(uuids), 'since': since}
+        try:
+            if uuids:
+                # Versioned writes so concurrent passes do not lose uuids.
+                options = {'version': version} if version else {'op_type': 'create'}
+                es.index(index=index, doc_type='meta', body=updated, id='referencing', **options)
+            elif version:
+                es.delete(index=index, doc_type='meta', id='referencing', version=version)
+        except ConflictError:
+            continue
+        return updated
+
+
+def timestamp(dt):
+    """ Seconds since the epoch of a timezone aware datetime.
+    """
+    return (dt - EPOCH).total_seconds()
+
+
+def dependencies_recorded(es, index):
+    """ Whether a full reindex has recorded the dependencies of every item.
+    """
+    return es.exists(index=index, doc_type='meta', id='dependencies')
+
+
+def advance_generation(es, index, xmin):
+    """ Mark searches of the index made before now as stale.
+    """
+    es.index(index=index, doc_type='meta', body={'xmin': xmin}, id='generation')
+
+
+def index_generation(es, index):
+    """ Identify the state of the index, changed after each indexing pass.
+
+    Generations sort in the order they were made: by the xmin of the pass,
+    then the concrete index name (distinguishing blue/green index versions)
+    and the document version. Returns None for an index never indexed.
+    """
+    try:
+        res = es.get(index=index, doc_type='meta', id='generation')
+    except NotFoundError:
+        return None
+    return '%020d/%s/%010d' % (res['_source']['xmin'], res['_index'], res['_version'])
+
+
+# Request stats accumulated while rendering and the divisor to seconds
+RENDER_STATS = {
+    'db_count': 1,
+    'db_time': 1e6,
+    'embedded_time': 1e6,
+    'object_time': 1e6,
+    'audit_time': 1e6,
+}
+TYPE_STATS = [
+    'rendered', 'render_time', 'written', 'write_time', 'skipped', 'failed',
+] + sorted(RENDER_STATS)
+
+
+def type_stats_for(stats, item_type):
+    """ The per item_type counters in stats['types'].
+    """
+    types = stats.setdefault('types', {})
+    if item_type not in types:
+        types[item_type] = {key: 0 for key in TYPE_STATS}
+    return types[item_type]
+
+
+def merge_stats(stats, other):
+    """ Add the counts and timings in other into stats, recursing into dicts.
+    """
+    for key, value in other.items():
+        if isinstance(value, dict):
+            merge_stats(stats.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            stats.setdefault(key, []).extend(value)
+        else:
+            stats[key] = stats.get(key, 0) + value
+
+
+def document_hash(document):
+    """ Hash of a rendered document which is stable across processes.
+    """
+    source = json.dumps(document, sort_keys=True, default=str)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def dependents(session, updated, renamed):
+    """ Return the uuids of documents which embed an updated item or link to a renamed one.
+    """
+    clauses = []
+    if updated:
+        clauses.append(and_(Dependency.embedded, Dependency.embedded_uuid.in_(updated)))
+    if renamed:
+        clauses.append(and_(Dependency.linked, Dependency.embedded_uuid.in_(renamed)))
+    if not clauses:
+        return set()
+    query = session.query(Dependency.uuid).filter(or_(*clauses)).distinct()
+    return {str(uuid) for uuid, in query}
+
+
+def indexing_order(root, types=None):
     # First index user and access_key so people can log in
     initial = ['user', 'access_key']
-    for collection_name in initial:
-        collection = root.by_item_type[collection_name]
-        if types is not None and collection_name not in types:
-            continue
-        for uuid in collection:
+    order = initial + sorted(name for name in root.by_item_type if name not in initial)
+    return [name for name in order if types is None or name in types]
+
+
+def all_uuids(root, types=None):
+    for item_type in indexing_order(root, types):
+        for uuid in root.by_item_type[item_type]:
             yield str(uuid)
-    for collection_name in sorted(root.by_item_type):
-        if collection_name in initial:
-            continue
-        if types is not None and collection_name not in types:
+
+
+def reindex_checkpoint(es, index, xmin, types):
+    """ Load the progress of an interrupted full reindex or start a new one.
+
+    The checkpoint keeps the xmin of the original run so that it is
+    recorded as last_xmin once the reindex completes.
+    """
+    try:
+        checkpoint = es.get(index=index, doc_type='meta', id='reindex')['_source']
+    except NotFoundError:
+        checkpoint = None
+    if checkpoint is None or checkpoint['types'] != types:
+        checkpoint = {
+            'xmin': xmin,
+            'types': types,
+            'done': [],
+            'item_type': None,
+            'cursor': None,
+        }
+    return checkpoint
+
+
+def reindex_plan(root, types=None, checkpoint=None):
+    """ Return [(item_type, uuids)] still to be indexed by a full reindex.
+
+    Uuids are sorted within each type so the checkpoint cursor is stable.
+    """
+    plan = []
+    for item_type in indexing_order(root, types):
+        if checkpoint is not None and item_type in checkpoint['done']:
             continue
-        collection = root.by_item_type[collection_name]
-        for uuid in collection:
-            yield str(uuid)
+        uuids = sorted(str(uuid) for uuid in root.by_item_type[item_type])
+        if checkpoint is not None and item_type == checkpoint['item_type']:
+            uuids = [uuid for uuid in uuids if uuid > checkpoint['cursor']]
+        plan.append((item_type, uuids))
+    return plan
+
+
+class BulkWriter(threading.Thread):
+    """ Write batches of rendered documents in a background thread.
+
+    The bounded queue blocks rendering when writes fall behind. After a
+    failure the remaining batches are drained without writing and the
+    exception is raised from put or close.
+    """
+    def __init__(self, indexer, xmin, index=None, maxsize=2):
+        super(BulkWriter, self).__init__(name='bulk-writer')
+        self.daemon = True
+        self.indexer = indexer
+        self.xmin = xmin
+        self.index = index
+        self.queue = Queue(maxsize)
+        self.errors = []
+        self.stats = {}
+        self.exception = None
+
+    def run(self):
+        while True:
+            documents = self.queue.get()
+            if documents is None:
+                return
+            if self.exception is not None:
+                continue
+            try:
+                self.errors.extend(self.indexer.index_documents(
+                    documents, self.xmin, self.index, self.stats))
+            except Exception as e:
+                log.error('Error writing %d documents', len(documents), exc_info=True)
+                self.exception = e
+
+    def put(self, documents):
+        if self.exception is not None:
+            raise self.exception
+        self.queue.put(documents)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.exception is not None:
+            raise self.exception
 
 
 class Indexer(object):
     def __init__(self, registry):
         self.es = registry[ELASTIC_SEARCH]
         self.index = registry.settings['snowfort.elasticsearch.index']
+        self.DBSession = registry[DBSESSION]
+        # Bounds for each _bulk request
+        self.bulk_count = int(registry.settings.get('indexer.bulk_count', 500))
+        self.bulk_size = humanfriendly.parse_size(
+            registry.settings.get('indexer.bulk_size', '10MB'))
+        # Keep every render time for percentiles, e.g. when benchmarking
+        self.record_timings = asbool(registry.settings.get('indexer.record_timings', False))
+        # Rendered batches waiting for the background writer
+        self.write_queue = int(registry.settings.get('indexer.write_queue', 2))
 
-    def update_objects(self, request, uuids, xmin, snapshot_id):
+    def update_objects(self, request, uuids, xmin, snapshot_id, index=None, stats=None):
+        if stats is None:
+            stats = {}
         errors = []
-        for i, uuid in enumerate(uuids):
-            error = self.update_object(request, uuid, xmin)
-            if error is not None:
-                errors.append(error)
-            if (i + 1) % 50 == 0:
-                log.info('Indexing %d', i + 1)
+        documents = []
+        size = 0
+        # Render the next batch while the previous one is written.
+        writer = BulkWriter(self, xmin, index, self.write_queue)
+        writer.start()
+        try:
+            for i, uuid in enumerate(uuids):
+                document, error = self.render_object(request, uuid, stats)
+                if error is not None:
+                    errors.append(error)
+                else:
+                    documents.append(document)
+                    size += len(document.source)
+                    if len(documents) >= self.bulk_count or size >= self.bulk_size:
+                        writer.put(documents)
+                        documents = []
+                        size = 0
+                if (i + 1) % 50 == 0:
+                    log.info('Indexing %d', i + 1)
 
+            if documents:
+                writer.put(documents)
+        finally:
+            writer.close()
+        errors.extend(writer.errors)
+        merge_stats(stats, writer.stats)
         return errors
 
-    def update_object(self, request, uuid, xmin):
+    def update_object(self, request, uuid, xmin, stats=None):
+        document, error = self.render_object(request, uuid, stats)
+        if error is not None:
+            return error
+        errors = self.index_documents([document], xmin, stats=stats)
+        if errors:
+            return errors[0]
+
+    def render_object(self, request, uuid, stats=None):
+        """ Render @@index-data as a Document with its serialized source.
+
+        Returns (document, None) or (None, error). The render time and the
+        request stats it incurred are added to stats['types'][item_type].
+        """
+        request_stats = getattr(request, '_stats', {})
+        before = {key: request_stats.get(key, 0) for key in RENDER_STATS}
+        start = time.time()
         try:
             result = request.embed('/%s/@@index-data' % uuid, as_user='INDEXER')
         except StatementError:
@@ -213,35 +563,174 @@ class Indexer(object):
         except Exception as e:
             log.error('Error rendering /%s/@@index-data', uuid, exc_info=True)
             timestamp = datetime.datetime.now().isoformat()
-            return {'error': repr(e), 'timestamp': timestamp, 'uuid': str(uuid)}
+            return None, {'error': repr(e), 'timestamp': timestamp, 'uuid': str(uuid)}
+        index_hash = document_hash(result)
+        source = self.es.transport.serializer.dumps(dict(result, index_hash=index_hash))
+        document = Document(
+            str(uuid), result['item_type'], source,
+            result['embedded_uuids'], result['linked_uuids'], index_hash)
+        if stats is not None:
+            elapsed = time.time() - start
+            type_stats = type_stats_for(stats, document.item_type)
+            type_stats['rendered'] += 1
+            type_stats['render_time'] += elapsed
+            if self.record_timings:
+                type_stats.setdefault('render_times', []).append(elapsed)
+            for key, scale in RENDER_STATS.items():
+                type_stats[key] += (request_stats.get(key, 0) - before[key]) / scale
+        return document, None
+
+    def index_documents(self, documents, xmin, index=None, stats=None):
+        """ Write the changed documents and record the dependencies of those
+        indexed or skipped as unchanged.
+        """
+        unchanged = self.unchanged(documents, index)
+        changed = [doc for doc in documents if doc.uuid not in unchanged]
+        start = time.time()
+        errors = self.bulk_index(changed, xmin, index)
+        elapsed = time.time() - start
+        failed = {error['uuid'] for error in errors}
+        self.update_dependencies([doc for doc in documents if doc.uuid not in failed], xmin)
+        if stats is not None:
+            stats['skipped'] = stats.get('skipped', 0) + len(unchanged)
+            written = len(changed) - len(failed)
+            # A bulk request mixes types, so share its time out by document
+            for doc in documents:
+                type_stats = type_stats_for(stats, doc.item_type)
+                if doc.uuid in unchanged:
+                    type_stats['skipped'] += 1
+                elif doc.uuid in failed:
+                    type_stats['failed'] += 1
+                else:
+                    type_stats['written'] += 1
+                    type_stats['write_time'] += elapsed / written
+        return errors
+
+    def unchanged(self, documents, index=None):
+        """ Return the uuids of documents already indexed with the same hash.
+        """
+        if index is None:
+            index = self.index
+        body = {'docs': [
+            {'_type': doc.item_type, '_id': doc.uuid, '_source': ['index_hash']}
+            for doc in documents
+        ]}
+        try:
+            res = self.es.mget(index=index, body=body, request_timeout=30)
+        except (ConnectionError, ReadTimeoutError, TransportError) as e:
+            log.warning('Could not fetch index hashes: %r', e)
+            return set()
+        hashes = {doc.uuid: doc.index_hash for doc in documents}
+        return {
+            found['_id'] for found in res['docs']
+            if found.get('found') and found['_source'].get('index_hash') == hashes[found['_id']]
+        }
 
-        last_exc = None
+    def bulk_index(self, documents, xmin, index=None):
+        """ Index rendered documents with a _bulk request.
+
+        Documents rejected with a retryable status, or the whole request on
+        connection errors, are retried with backoff. Version conflicts mean a
+        newer version is already indexed. Returns error entries for the
+        documents which could not be indexed.
+        """
+        if not documents:
+            return []
+        if index is None:
+            index = self.index
+        serializer = self.es.transport.serializer
+        pending = OrderedDict((doc.uuid, (doc.item_type, doc.source)) for doc in documents)
+        errors = {}
         for backoff in [0, 10, 20, 40, 80]:
             time.sleep(backoff)
+            body = []
+            for uuid, (item_type, source) in pending.items():
+                body.append(serializer.dumps({'index': {
+                    '_index': index, '_type': item_type, '_id': uuid,
+                    '_version': xmin, '_version_type': 'external_gte',
+                }}))
+                body.append(source)
             try:
-                self.es.index(
-                    index=self.index, doc_type=result['item_type'], body=result,
-                    id=str(uuid), version=xmin, version_type='external_gte',
-                    request_timeout=30,
-                )
-            except StatementError:
-                # Can't reconnect until invalid transaction is rolled back
-                raise
-            except ConflictError:
-                log.warning('Conflict indexing %s at version %d', uuid, xmin)
-                return
+                res = self.es.bulk(body=body, request_timeout=30)
             except (ConnectionError, ReadTimeoutError, TransportError) as e:
-                log.warning('Retryable error indexing %s: %r', uuid, e)
-                last_exc = repr(e)
+                log.warning('Retryable error indexing %d documents: %r', len(pending), e)
+                errors.update((uuid, repr(e)) for uuid in pending)
+                continue
             except Exception as e:
-                log.error('Error indexing %s', uuid, exc_info=True)
-                last_exc = repr(e)
+                log.error('Error indexing %d documents', len(pending), exc_info=True)
+                errors.update((uuid, repr(e)) for uuid in pending)
+                break
+
+            retry = OrderedDict()
+            for item in res['items']:
+                status = item['index']
+                uuid = status['_id']
+                if status['status'] < 300:
+                    errors.pop(uuid, None)
+                elif status['status'] == 409:
+                    log.warning('Conflict indexing %s at version %d', uuid, xmin)
+                    errors.pop(uuid, None)
+                elif status['status'] in (429, 503):
+                    log.warning('Retryable error indexing %s: %r', uuid, status.get('error'))
+                    errors[uuid] = status.get('error')
+                    retry[uuid] = pending[uuid]
+                else:
+                    log.error('Error indexing %s: %r', uuid, status.get('error'))
+                    errors[uuid] = status.get('error')
+            pending = retry
+            if not pending:
                 break
-            else:
-                return
 
         timestamp = datetime.datetime.now().isoformat()
-        return {'error': last_exc, 'timestamp': timestamp, 'uuid': str(uuid)}
+        return [
+            {'error': error, 'timestamp': timestamp, 'uuid': uuid}
+            for uuid, error in errors.items()
+        ]
+
+    def update_dependencies(self, documents, xmin):
+        """ Replace the recorded dependencies of the rendered documents.
+
+        Written on a separate connection as indexing runs in a read only
+        transaction. Dependencies recorded from a newer snapshot, by a
+        concurrent indexer, are kept. Only writers of the same items wait
+        on each other.
+        """
+        if not documents:
+            return
+        table = Dependency.__table__
+        uuids = [str(doc.uuid) for doc in documents]
+        with self.DBSession.bind.begin() as connection:
+            # Held until commit so the check for newer rows stays true.
+            connection.execute(
+                LOCK_DEPENDENCIES, namespace=DEPENDENCY_LOCK_NAMESPACE, uuids=uuids).fetchall()
+            newer = {
+                str(uuid) for uuid, in connection.execute(
+                    select([table.c.uuid]).where(table.c.uuid.in_(uuids))
+                    .where(table.c.xmin > xmin).distinct())
+            }
+            connection.execute(table.delete().where(
+                table.c.uuid.in_([uuid for uuid in uuids if uuid not in newer])))
+            rows = self.dependency_rows(
+                [doc for doc in documents if doc.uuid not in newer], xmin)
+            if rows:
+                connection.execute(table.insert(), rows)
+
+    def dependency_rows(self, documents, xmin):
+        rows = []
+        for doc in documents:
+            embedded = set(doc.embedded_uuids)
+            linked = set(doc.linked_uuids)
+            rows.extend(
+                {
+                    'embedded_uuid': embedded_uuid,
+                    'uuid': doc.uuid,
+                    'embedded': embedded_uuid in embedded,
+                    'linked': embedded_uuid in linked,
+                    'xmin': xmin,
+                }
+                for embedded_uuid in sorted(embedded | linked)
+            )
+        return rows
 
     def shutdown(self):
         pass
@@ -1,4 +1,6 @@
 from snowfort import DBSESSION
+from snowfort.storage import Resource
+from collections import defaultdict
 from contextlib import contextmanager
 from multiprocessing import get_context
 from multiprocessing.pool import Pool
@@ -10,16 +12,21 @@ from pyramid.threadlocal import (
 )
 import atexit
 import logging
+import os
 import time
 import transaction
 from .indexer import (
     INDEXER,
     Indexer,
+    merge_stats,
 )
 from .interfaces import APP_FACTORY
 
 log = logging.getLogger(__name__)
 
+# Seconds, the least expected render cost of a uuid when scheduling
+MIN_COST = 1e-6
+
 
 def includeme(config):
     if config.registry.settings.get('indexer_worker'):
@@ -52,7 +59,12 @@ def set_snapshot(xmin, snapshot_id):
         return
     clear_snapshot()
     current_xmin_snapshot_id = (xmin, snapshot_id)
+    begin_snapshot(app, xmin, snapshot_id)
+
 
+def begin_snapshot(app, xmin, snapshot_id):
+    """ Begin a doomed transaction in the snapshot and push an indexing request.
+    """
     while True:
         txn = transaction.begin()
         txn.doom()
@@ -97,23 +109,28 @@ def snapshot(xmin, snapshot_id):
     signal.alarm(5)
 
 
-def update_object_in_snapshot(args):
-    uuid, xmin, snapshot_id = args
+def update_objects_in_snapshot(args):
+    uuids, xmin, snapshot_id, index = args
     with snapshot(xmin, snapshot_id):
         request = get_current_request()
         indexer = request.registry[INDEXER]
-        return indexer.update_object(request, uuid, xmin)
+        stats = {}
+        errors = indexer.update_objects(request, uuids, xmin, snapshot_id, index, stats)
+        return len(uuids), errors, stats
 
 
 # Running in main process
 
 class MPIndexer(Indexer):
-    chunksize = 32
+    # Aim for several chunks per process so the short ones even out finishing times.
+    chunks_per_process = 4
 
     def __init__(self, registry, processes=None):
         super(MPIndexer, self).__init__(registry)
         self.processes = processes
         self.initargs = (registry[APP_FACTORY], registry.settings,)
+        # Average render seconds per item_type from previous runs
+        self.costs = {}
 
     @reify
     def pool(self):
@@ -124,22 +141,84 @@ class MPIndexer(Indexer):
             context=get_context('forkserver'),
         )
 
-    def update_objects(self, request, uuids, xmin, snapshot_id):
+    def update_objects(self, request, uuids, xmin, snapshot_id, index=None, stats=None):
+        if stats is None:
+            stats = {}
         # Ensure that we iterate over uuids in this thread not the pool task handler.
-        tasks = [(uuid, xmin, snapshot_id) for uuid in uuids]
+        # Each worker renders a chunk and sends it to elasticsearch in bulk.
+        tasks = [
+            (chunk, xmin, snapshot_id, index)
+            for chunk in self.schedule(request, list(uuids))
+        ]
         errors = []
+        run_stats = {}
+        done = 0
         try:
-            for i, error in enumerate(self.pool.imap_unordered(
-                    update_object_in_snapshot, tasks, self.chunksize)):
-                if error is not None:
-                    errors.append(error)
-                if (i + 1) % 50 == 0:
-                    log.info('Indexing %d', i + 1)
+            for count, chunk_errors, chunk_stats in self.pool.imap_unordered(
+                    update_objects_in_snapshot, tasks):
+                errors.extend(chunk_errors)
+                merge_stats(run_stats, chunk_stats)
+                if (done + count) // 50 > done // 50:
+                    log.info('Indexing %d', done + count)
+                done += count
         except:
             self.shutdown()
             raise
+        self.update_costs(run_stats.get('types', {}))
+        merge_stats(stats, run_stats)
         return errors
 
+    def schedule(self, request, uuids):
+        """ Split uuids into chunks of similar expected cost, most expensive first.
+
+        Each worker takes the next chunk when it finishes one, so running the
+        longest chunks first leaves the cheap ones to fill in at the end.
+        Costs are measured by this process, so they start over on restart.
+        """
+        if not uuids:
+            return []
+        item_types = self.item_types(request, uuids)
+        default = sum(self.costs.values()) / len(self.costs) if self.costs else 1.0
+        by_type = defaultdict(list)
+        for uuid in uuids:
+            by_type[item_types.get(uuid)].append(uuid)
+
+        # Fast types may measure as free with a coarse timer.
+        costs = {
+            item_type: max(self.costs.get(item_type, default), MIN_COST)
+            for item_type in by_type
+        }
+        total = sum(costs[item_type] * len(type_uuids) for item_type, type_uuids in by_type.items())
+        processes = self.processes or os.cpu_count() or 1
+        target = total / (processes * self.chunks_per_process)
+
+        chunks = []
+        for item_type, type_uuids in by_type.items():
+            cost = costs[item_type]
+            size = int(min(max(target // cost, 1), self.bulk_count))
+            for start in range(0, len(type_uuids), size):
+                chunk = type_uuids[start:start + size]
+                chunks.append((cost * len(chunk), chunk))
+        chunks.sort(key=lambda chunk: chunk[0], reverse=True)
+        return [chunk for cost, chunk in chunks]
+
+    def item_types(self, request, uuids, batchsize=1000):
+        session = request.registry[DBSESSION]()
+        item_types = {}
+        for start in range(0, len(uuids), batchsize):
+            query = session.query(Resource.rid, Resource.item_type).filter(
+                Resource.rid.in_(uuids[start:start + batchsize]))
+            item_types.update((str(rid), item_type) for rid, item_type in query)
+        return item_types
+
+    def update_costs(self, types):
+        for item_type, type_stats in types.items():
+            if not type_stats.get('rendered'):
+                continue
+            cost = type_stats['render_time'] / type_stats['rendered']
+            previous = self.costs.get(item_type)
+            self.costs[item_type] = cost if previous is None else (previous + cost) / 2
+
     def shutdown(self):
         if 'pool' in self.__dict__:
             self.pool.terminate()
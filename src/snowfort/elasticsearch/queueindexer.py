@@ -0,0 +1,271 @@
+"""\
+Distributed indexing through a postgres work queue.
+
+With ``indexer.queue`` set the /index view enqueues batches of invalidated
+uuids and waits for workers, on any host, to claim and index them:
+
+    %(prog)s production.ini
+
+"""
+from pyramid.paster import get_app
+from pyramid.threadlocal import (
+    get_current_request,
+    manager,
+)
+from snowfort.storage import IndexQueue
+from sqlalchemy import (
+    func,
+    select,
+    text,
+)
+from .indexer import (
+    INDEXER,
+    Indexer,
+    merge_stats,
+)
+from .interfaces import APP_FACTORY
+from .mpindexer import begin_snapshot
+import datetime
+import logging
+import time
+import transaction
+import uuid
+
+EPILOG = __doc__
+
+log = logging.getLogger(__name__)
+
+# Batches are claimed with a transaction level advisory lock keyed on
+# (LOCK_NAMESPACE, id), so a crashed worker's batch becomes available again
+# when its connection goes away. (SKIP LOCKED requires postgres 9.5.)
+LOCK_NAMESPACE = 1901
+TRY_LOCK = text("SELECT pg_try_advisory_xact_lock(:namespace, :id)")
+# Unlocked batches are looked for among the first of those not done.
+CLAIM_CANDIDATES = 100
+
+
+class IndexQueueTimeout(Exception):
+    pass
+
+
+def includeme(config):
+    if config.registry.settings.get('indexer_worker'):
+        return
+    config.registry[INDEXER] = QueueIndexer(config.registry)
+
+
+def batch_errors(uuids, error):
+    timestamp = datetime.datetime.now().isoformat()
+    return [{'error': error, 'timestamp': timestamp, 'uuid': str(uuid)} for uuid in uuids]
+
+
+# Running in the coordinator
+
+class QueueIndexer(Indexer):
+    def __init__(self, registry):
+        super(QueueIndexer, self).__init__(registry)
+        settings = registry.settings
+        self.batch_size = int(settings.get('indexer.queue_batch', self.bulk_count))
+        self.poll_interval = float(settings.get('indexer.queue_poll', 1))
+        # Seconds to wait for a job to finish, and for any worker to start it
+        self.timeout = float(settings.get('indexer.queue_timeout', 3600))
+        self.stall_timeout = float(settings.get('indexer.queue_stall', 300))
+
+    def update_objects(self, request, uuids, xmin, snapshot_id, index=None, stats=None):
+        """ Enqueue the uuids and wait until workers have indexed them all.
+
+        The snapshot exported by /index stays valid for the workers because
+        its transaction remains open while we wait. Raises IndexQueueTimeout
+        when the job is not done in time, so /index does not record its xmin.
+        """
+        if stats is None:
+            stats = {}
+        if index is None:
+            index = self.index
+        uuids = list(uuids)
+        if not uuids:
+            return []
+        job = uuid.uuid4()
+        table = IndexQueue.__table__
+        rows = [
+            {
+                'job': job,
+                'xmin': xmin,
+                'snapshot_id': snapshot_id,
+                'index_name': index,
+                'uuids': uuids[start:start + self.batch_size],
+            }
+            for start in range(0, len(uuids), self.batch_size)
+        ]
+        engine = self.DBSession.bind
+        with engine.begin() as connection:
+            # Jobs left behind by coordinators which died while waiting
+            connection.execute(table.delete().where(
+                table.c.created < func.now() - datetime.timedelta(seconds=self.timeout)))
+            connection.execute(table.insert(), rows)
+
+        try:
+            self.wait(job, len(rows))
+            errors = []
+            with engine.connect() as connection:
+                finished = connection.execute(
+                    table.select().where(table.c.job == job)).fetchall()
+            for row in finished:
+                errors.extend(row.errors or ())
+                merge_stats(stats, row.stats or {})
+            return errors
+        finally:
+            with engine.begin() as connection:
+                connection.execute(table.delete().where(table.c.job == job))
+
+    def wait(self, job, count):
+        table = IndexQueue.__table__
+        engine = self.DBSession.bind
+        start = time.time()
+        done = 0
+        while True:
+            time.sleep(self.poll_interval)
+            with engine.connect() as connection:
+                remaining, attempts = connection.execute(
+                    select([func.count(), func.coalesce(func.sum(table.c.attempts), 0)])
+                    .select_from(table)
+                    .where(table.c.job == job).where(~table.c.done)
+                ).first()
+            if remaining == 0:
+                return
+            elapsed = time.time() - start
+            if count - remaining != done:
+                done = count - remaining
+                log.info('Indexing batches %d of %d done', done, count)
+            if not done and not attempts and elapsed > self.stall_timeout:
+                raise IndexQueueTimeout(
+                    'No indexing worker claimed a batch in %d seconds' % elapsed)
+            if elapsed > self.timeout:
+                raise IndexQueueTimeout(
+                    'Indexing batches %d of %d done after %d seconds' % (done, count, elapsed))
+
+
+# Running in the workers
+
+def claim_batch(connection):
+    """ Lock and return the first unlocked batch which is not done, or None.
+    """
+    table = IndexQueue.__table__
+    candidates = connection.execute(
+        select([table.c.id]).where(~table.c.done)
+        .order_by(table.c.id).limit(CLAIM_CANDIDATES)
+    ).fetchall()
+    for batch_id, in candidates:
+        if not connection.execute(TRY_LOCK, namespace=LOCK_NAMESPACE, id=batch_id).scalar():
+            continue
+        # It may have been finished by the worker which held the lock.
+        row = connection.execute(
+            table.select().where(table.c.id == batch_id).where(~table.c.done)).first()
+        if row is not None:
+            return row
+    return None
+
+
+def index_batch(app, row):
+    pushed = False
+    try:
+        begin_snapshot(app, row.xmin, row.snapshot_id)
+        pushed = True
+        request = get_current_request()
+        stats = {}
+        errors = app.registry[INDEXER].update_objects(
+            request, row.uuids, row.xmin, row.snapshot_id, row.index_name, stats)
+        return errors, stats
+    finally:
+        transaction.abort()
+        if pushed:
+            manager.pop()
+
+
+def process_batch(app):
+    """ Claim one queued batch and index it. Returns False when the queue is empty.
+
+    A batch which fails (or whose worker dies) ``indexer.queue_attempts``
+    times is marked done with an error for each of its uuids.
+    """
+    registry = app.registry
+    max_attempts = int(registry.settings.get('indexer.queue_attempts', 3))
+    table = IndexQueue.__table__
+    engine = registry[INDEXER].DBSession.bind
+    connection = engine.connect()
+    try:
+        with connection.begin():
+            row = claim_batch(connection)
+            if row is None:
+                return False
+            if row.attempts >= max_attempts:
+                log.error('Giving up on batch %d after %d attempts', row.id, row.attempts)
+                values = {
+                    'done': True,
+                    'errors': row.errors or batch_errors(
+                        row.uuids, 'Abandoned after %d attempts' % row.attempts),
+                }
+            else:
+                # Counted outside the claim so it survives the worker dying.
+                with engine.begin() as counter:
+                    counter.execute(
+                        table.update().where(table.c.id == row.id)
+                        .values(attempts=table.c.attempts + 1))
+                attempts = row.attempts + 1
+                try:
+                    errors, stats = index_batch(app, row)
+                except Exception as e:
+                    log.error(
+                        'Error indexing batch %d, attempt %d of %d',
+                        row.id, attempts, max_attempts, exc_info=True)
+                    values = {
+                        'done': attempts >= max_attempts,
+                        'errors': batch_errors(row.uuids, repr(e)),
+                    }
+                else:
+                    log.info('Indexed %d uuids', len(row.uuids))
+                    values = {'done': True, 'errors': errors, 'stats': stats}
+            connection.execute(table.update().where(table.c.id == row.id).values(**values))
+    finally:
+        connection.close()
+    return True
+
+
+def run(app, poll_interval=1):
+    while True:
+        try:
+            processed = process_batch(app)
+        except Exception:
+            log.error('Error processing the indexing queue', exc_info=True)
+            processed = False
+        if not processed:
+            time.sleep(poll_interval)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Index batches from the postgres indexing queue", epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument(
+        '--poll-interval', type=float, default=1,
+        help="Seconds to wait when the queue is empty")
+    parser.add_argument('config_uri', help="path to configfile")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    app = get_app(args.config_uri, args.app_name)
+    # Build the worker app as the multiprocessing indexer does.
+    app = app.registry[APP_FACTORY](
+        app.registry.settings, indexer_worker=True, create_tables=False)
+
+    # Loading app will have configured from config file. Reconfigure here:
+    logging.getLogger('snowfort').setLevel(logging.INFO)
+
+    return run(app, args.poll_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
-from copy import deepcopy
 from .cache import ManagerLRUCache
+from .interfaces import ROOT
+from .resource_views import item_view_object
+from .resources import Item
 from past.builtins import basestring
 from posixpath import join
 from pyramid.compat import (
@@ -7,6 +9,17 @@ from pyramid.compat import (
     unquote_bytes_to_wsgi,
 )
 from pyramid.httpexceptions import HTTPNotFound
+from pyramid.interfaces import (
+    IView,
+    IViewClassifier,
+)
+from pyramid.request import apply_request_extensions
+from pyramid.threadlocal import manager as threadlocal_manager
+from pyramid.traversal import (
+    decode_path_info,
+    traverse,
+)
+from zope.interface import providedBy
 import logging
 log = logging.getLogger(__name__)
 
@@ -18,6 +31,7 @@ def includeme(config):
     config.add_request_method(lambda request: set(), '_embedded_uuids', reify=True)
     config.add_request_method(lambda request: set(), '_linked_uuids', reify=True)
     config.add_request_method(lambda request: None, '__parent__', reify=True)
+    config.add_request_method(object_request, '_object_request', reify=True)
 
 
 def make_subrequest(request, path):
@@ -45,11 +59,77 @@ def make_subrequest(request, path):
     return subreq
 
 
+class FrozenDict(dict):
+    """ Read only dict for results shared through the embed cache.
+
+    Copy with ``dict(value)`` or ``value.copy()`` before modifying.
+    """
+    def _immutable(self, *args, **kw):
+        raise TypeError('embedded results are read only, copy before modifying')
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class FrozenList(list):
+    """ Read only list for results shared through the embed cache.
+    """
+    def _immutable(self, *args, **kw):
+        raise TypeError('embedded results are read only, copy before modifying')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    if str is bytes:
+        __setslice__ = __delslice__ = _immutable
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+def freeze(value):
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """ Return a mutable deep copy of a (possibly frozen) embedded result.
+    """
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    return value
+
+
 embed_cache = ManagerLRUCache('embed_cache')
 
 
 def embed(request, *elements, **kw):
     """ as_user=True for current user
+
+    Results without as_user are shared through the embed cache and returned
+    frozen. Callers that need to modify them must copy first.
     """
     # Should really be more careful about what gets included instead.
     # Cache cut response time from ~800ms to ~420ms.
@@ -62,10 +142,10 @@ def embed(request, *elements, **kw):
     else:
         cached = embed_cache.get(path, None)
         if cached is None:
-            cached = _embed(request, path)
+            result, embedded, linked = _embed_object(request, path) or _embed(request, path)
+            cached = freeze(result), embedded, linked
             embed_cache[path] = cached
         result, embedded, linked = cached
-        result = deepcopy(result)
     request._embedded_uuids.update(embedded)
     request._linked_uuids.update(linked)
     return result
@@ -85,6 +165,57 @@ def _embed(request, path, as_user='EMBED'):
     return result, subreq._embedded_uuids, subreq._linked_uuids
 
 
+def object_request(request):
+    """ The EMBED request used to render @@object frames in process.
+
+    Created once per request and shared by nested embeds.
+    """
+    subreq = make_subrequest(request, '/')
+    if 'HTTP_COOKIE' in subreq.environ:
+        del subreq.environ['HTTP_COOKIE']
+    subreq.remote_user = 'EMBED'
+    subreq.registry = request.registry
+    apply_request_extensions(subreq)
+    subreq.root = request.registry[ROOT]
+    subreq._object_request = subreq
+    return subreq
+
+
+def _embed_object(request, path):
+    """ Render an item's @@object frame without a subrequest.
+
+    Resolves the item by traversal and calls item_view_object directly,
+    skipping the router, view lookup and renderer. Returns None when the path
+    is anything else, so the caller falls back to a real subrequest.
+    """
+    if not path.endswith('/@@object') or '?' in path:
+        return None
+    subreq = request._object_request
+    names = decode_path_info(path[:-len('@@object')]).split('/')
+    info = traverse(subreq.root, names)
+    context = info['context']
+    if info['view_name'] or not isinstance(context, Item):
+        return None
+    view = subreq.registry.adapters.lookup(
+        (IViewClassifier, subreq.request_iface, providedBy(context)), IView, name='object')
+    if getattr(view, '__original_view__', None) is not item_view_object:
+        return None
+    if not subreq.has_permission('view', context):
+        return None
+
+    saved = subreq._embedded_uuids, subreq._linked_uuids, getattr(subreq, 'context', None)
+    subreq._embedded_uuids = set()
+    subreq._linked_uuids = set()
+    subreq.context = context
+    threadlocal_manager.push({'request': subreq, 'registry': subreq.registry})
+    try:
+        result = item_view_object(context, subreq)
+        return result, subreq._embedded_uuids, subreq._linked_uuids
+    finally:
+        threadlocal_manager.pop()
+        subreq._embedded_uuids, subreq._linked_uuids, subreq.context = saved
+
+
 class NullRenderer:
     '''Sets result value directly as response.
     '''
@@ -5,6 +5,7 @@ CALCULATED_PROPERTIES = 'calculated_properties'
 COLLECTIONS = 'collections'
 CONNECTION = 'connection'
 DBSESSION = 'dbsession'
+REPLICA_DBSESSION = 'replica_dbsession'
 STORAGE = 'storage'
 ROOT = 'root'
 TYPES = 'types'
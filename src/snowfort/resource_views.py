@@ -67,7 +67,7 @@ def collection_view_listing_db(context, request):
 
 @view_config(context=Root, request_method='GET', name='page')
 def home(context, request):
-    properties = request.embed(request.resource_path(context), '@@object')
+    properties = request.embed(request.resource_path(context), '@@object').copy()
     calculated = calculate_properties(context, request, properties, category='page')
     properties.update(calculated)
     return properties
@@ -85,7 +85,7 @@ def collection_view_object(context, request):
 @view_config(context=AbstractCollection, permission='list', request_method='GET', name='page')
 def collection_list(context, request):
     path = request.resource_path(context)
-    properties = request.embed(path, '@@object')
+    properties = request.embed(path, '@@object').copy()
     calculated = calculate_properties(context, request, properties, category='page')
     properties.update(calculated)
 
@@ -149,6 +149,7 @@ def uuid_to_path(request, obj, path):
         return
     conn = request.registry[CONNECTION]
     if isinstance(value, list):
+        conn.get_by_uuids(value)
         obj[name] = [
             request.resource_path(conn[v])
             for v in value
@@ -176,7 +177,7 @@ def item_view_object(context, request):
              name='embedded')
 def item_view_embedded(context, request):
     item_path = request.resource_path(context)
-    properties = request.embed(item_path, '@@object')
+    properties = request.embed(item_path, '@@object').copy()
     for path in context.embedded:
         expand_path(request, properties, path)
     return properties
@@ -186,7 +187,7 @@ def item_view_embedded(context, request):
              name='page')
 def item_view_page(context, request):
     item_path = request.resource_path(context)
-    properties = request.embed(item_path, '@@embedded')
+    properties = request.embed(item_path, '@@embedded').copy()
     calculated = calculate_properties(context, request, properties, category='page')
     properties.update(calculated)
     return properties
@@ -196,7 +197,7 @@ def item_view_page(context, request):
              name='expand')
 def item_view_expand(context, request):
     path = request.resource_path(context)
-    properties = request.embed(path, '@@object')
+    properties = request.embed(path, '@@object').copy()
     for path in request.params.getall('expand'):
         expand_path(request, properties, path)
     return properties
@@ -271,9 +272,8 @@ def item_view_edit(context, request):
     for propname in schema_rev_links:
         properties[propname] = sorted(
             request.resource_path(child)
-            for child in (
-                conn.get_by_uuid(uuid) for uuid in context.get_rev_links(propname)
-            ) if request.has_permission('visible_for_edit', child)
+            for child in conn.get_by_uuids(context.get_rev_links(propname))
+            if request.has_permission('visible_for_edit', child)
         )
 
     return properties
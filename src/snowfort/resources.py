@@ -266,22 +266,32 @@ class Item(Resource):
         }
 
     def upgrade_properties(self):
-        properties = deepcopy(self.properties)
-        current_version = properties.get('schema_version', '')
+        current_version = self.properties.get('schema_version', '')
         target_version = self.type_info.schema_version
-        if target_version is not None and current_version != target_version:
-            upgrader = self.registry[UPGRADER]
-            try:
-                properties = upgrader.upgrade(
-                    self.type_info.name, properties, current_version, target_version,
-                    context=self, registry=self.registry)
-            except RuntimeError:
-                raise
-            except Exception:
-                logger.warning(
-                    'Unable to upgrade %s from %r to %r',
-                    resource_path(self.__parent__, self.uuid),
-                    current_version, target_version, exc_info=True)
+        if target_version is None or current_version == target_version:
+            return deepcopy(self.properties)
+        upgrader = self.registry[UPGRADER]
+        key = None
+        if self.tid is not None:
+            key = (str(self.uuid), self.tid, current_version, target_version)
+            cached = upgrader.cache.get(key)
+            if cached is not None:
+                return deepcopy(cached)
+        properties = deepcopy(self.properties)
+        try:
+            properties = upgrader.upgrade(
+                self.type_info.name, properties, current_version, target_version,
+                context=self, registry=self.registry)
+        except RuntimeError:
+            raise
+        except Exception:
+            logger.warning(
+                'Unable to upgrade %s from %r to %r',
+                resource_path(self.__parent__, self.uuid),
+                current_version, target_version, exc_info=True)
+            return properties
+        if key is not None:
+            upgrader.cache[key] = deepcopy(properties)
         return properties
 
     def __json__(self, request):
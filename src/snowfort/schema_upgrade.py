@@ -0,0 +1,66 @@
+"""\
+Bring an existing database up to date with the storage models.
+
+``create_tables`` only creates missing tables, so after upgrading run this
+to also add the columns and indexes introduced since the database was
+created:
+
+    %(prog)s production.ini --app-name app
+
+"""
+from pyramid.paster import get_app
+from sqlalchemy import inspect
+from snowfort import DBSESSION
+from .storage import Base
+import logging
+
+EPILOG = __doc__
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables which may already exist: (table, column, DDL)
+NEW_COLUMNS = [
+    ('dependencies', 'xmin', 'BIGINT NOT NULL DEFAULT 0'),
+    ('index_queue', 'attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ('index_queue', 'created', 'TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()'),
+]
+
+
+def upgrade_schema(connection):
+    """ Create missing tables, columns and indexes. Safe to run repeatedly.
+    """
+    Base.metadata.create_all(bind=connection)
+    inspector = inspect(connection)
+    for table_name, column, ddl in NEW_COLUMNS:
+        if column not in {c['name'] for c in inspector.get_columns(table_name)}:
+            logger.info('Adding column %s.%s', table_name, column)
+            connection.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table_name, column, ddl))
+    # create_all skips the indexes of tables which already exist
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info('Creating index %s', index.name)
+                index.create(bind=connection)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Upgrade the database schema", epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--app-name', help="Pyramid app name in configfile")
+    parser.add_argument('config_uri', help="path to configfile")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    logger.setLevel(logging.INFO)
+    app = get_app(args.config_uri, args.app_name)
+    engine = app.registry[DBSESSION].bind
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+
+
+if __name__ == '__main__':
+    main()
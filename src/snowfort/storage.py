@@ -1,4 +1,10 @@
+from collections import (
+    OrderedDict,
+    defaultdict,
+)
+from itertools import islice
 from pyramid.httpexceptions import HTTPConflict
+from pyramid.settings import asbool
 from sqlalchemy import (
     Column,
     DDL,
@@ -10,6 +16,7 @@ from sqlalchemy import (
     orm,
     schema,
     text,
+    tuple_,
     types,
 )
 from sqlalchemy.dialects import postgresql
@@ -24,23 +31,34 @@ from sqlalchemy.orm.exc import (
 from .interfaces import (
     BLOBS,
     DBSESSION,
+    REPLICA_DBSESSION,
     STORAGE,
 )
 from .json_renderer import json_renderer
+from .util import get_root_request
+from zope.sqlalchemy import mark_changed
 import boto
+import humanfriendly
 import json
+import threading
 import transaction
 import uuid
 
 
 def includeme(config):
     registry = config.registry
-    registry[STORAGE] = RDBStorage(registry[DBSESSION])
+    model_cache = None
+    model_cache_size = registry.settings.get('snowfort.model_cache.size')
+    if model_cache_size:
+        model_cache = ModelCache(humanfriendly.parse_size(model_cache_size))
+    registry[STORAGE] = RDBStorage(
+        registry[DBSESSION], model_cache, registry.get(REPLICA_DBSESSION))
     if registry.settings.get('blob_bucket'):
         registry[BLOBS] = S3BlobStorage(
             registry.settings['blob_bucket'],
             read_profile_name=registry.settings.get('blob_read_profile_name'),
             store_profile_name=registry.settings.get('blob_store_profile_name'),
+            redirect=asbool(registry.settings.get('blob_redirect', True)),
         )
     else:
         registry[BLOBS] = RDBBlobStorage(registry[DBSESSION])
@@ -64,9 +82,12 @@ baked_query_unique_key = bakery(
 
 class RDBStorage(object):
     batchsize = 1000
+    replica_key = '_snowfort_read_replica'
 
-    def __init__(self, DBSession):
+    def __init__(self, DBSession, model_cache=None, ReplicaDBSession=None):
         self.DBSession = DBSession
+        self.model_cache = model_cache
+        self.ReplicaDBSession = ReplicaDBSession
 
     @property
     def write(self):
@@ -76,32 +97,118 @@ class RDBStorage(object):
     def read(self):
         return self
 
+    def read_session(self):
+        ''' Session for read paths.
+
+        Read only transactions use the replica, when one is configured and has
+        caught up with the edits recorded in the user's session so users read
+        their own writes. Decided once per transaction.
+        '''
+        if self.ReplicaDBSession is None:
+            return self.DBSession()
+        data = transaction.get()._extension
+        use_replica = data.get(self.replica_key)
+        if use_replica is None:
+            use_replica = data[self.replica_key] = self._replica_caught_up(data)
+        if use_replica:
+            return self.ReplicaDBSession()
+        return self.DBSession()
+
+    def _replica_caught_up(self, data):
+        # Indexer snapshots are exported from the primary.
+        if 'snapshot_id' in data or not is_read_only_transaction():
+            return False
+        request = get_root_request()
+        if request is None:
+            return True
+        edits = dict.get(request.session, 'edits', None)
+        if not edits:
+            return True
+        last_xid = max(xid for xid, updated, renamed in edits)
+        # Transactions older than the snapshot's xmin are visible to it.
+        xmin = self.ReplicaDBSession().connection().execute(
+            "SELECT txid_snapshot_xmin(txid_current_snapshot());").scalar()
+        return last_xid < xmin
+
+    def _model_cache_xmin(self):
+        ''' Snapshot xmin when the process wide model cache may be used.
+        '''
+        if self.model_cache is None or not is_read_only_transaction():
+            return None
+        return self.model_cache.validate(self.read_session())
+
     def get_by_uuid(self, rid, default=None):
-        session = self.DBSession()
-        model = baked_query_resource(session).get(uuid.UUID(rid))
+        rid = uuid.UUID(str(rid))
+        xmin = self._model_cache_xmin()
+        if xmin is not None:
+            cached = self.model_cache.get(rid, xmin)
+            if cached is not None:
+                return cached
+        session = self.read_session()
+        model = baked_query_resource(session).get(rid)
         if model is None:
             return default
+        if xmin is not None:
+            return self.model_cache.add(model, xmin)
         return model
 
     def get_by_unique_key(self, unique_key, name, default=None):
-        session = self.DBSession()
+        pkey = (unique_key, name)
+        xmin = self._model_cache_xmin()
+        if xmin is not None:
+            cached = self.model_cache.get_by_key(pkey, xmin)
+            if cached is not None:
+                return cached
+        session = self.read_session()
         try:
             key = baked_query_unique_key(session).params(name=unique_key, value=name).one()
         except NoResultFound:
             return default
-        else:
-            return key.resource
+        if xmin is not None:
+            return self.model_cache.add(key.resource, xmin, pkey)
+        return key.resource
+
+    def get_by_uuids(self, rids):
+        ''' Load many resources with their current propsheets.
+
+        Uses one ``IN (...)`` query per ``batchsize`` rids. Unknown rids are
+        skipped and the order of the result is undefined.
+        '''
+        session = self.read_session()
+        rids = [uuid.UUID(str(rid)) for rid in rids]
+        models = []
+        xmin = self._model_cache_xmin()
+        if xmin is not None:
+            missing = []
+            for rid in rids:
+                cached = self.model_cache.get(rid, xmin)
+                if cached is None:
+                    missing.append(rid)
+                else:
+                    models.append(cached)
+            rids = missing
+        for batch in self._batches(rids):
+            query = session.query(Resource).filter(Resource.rid.in_(batch))
+            if xmin is None:
+                models.extend(query.all())
+            else:
+                models.extend(self.model_cache.add(model, xmin) for model in query)
+        return models
 
     def get_rev_links(self, model, rel, *item_types):
+        session = self.read_session()
+        query = session.query(Link.source_rid).filter(
+            Link.target_rid == model.rid,
+            Link.rel == rel,
+        )
         if item_types:
-            return [
-                link.source_rid for link in model.revs
-                if link.rel == rel and link.source.item_type in item_types]
-        else:
-            return [link.source_rid for link in model.revs if link.rel == rel]
+            query = query.join(Resource, Link.source_rid == Resource.rid).filter(
+                Resource.item_type.in_(item_types)
+            )
+        return [rid for rid, in query]
 
     def __iter__(self, *item_types):
-        session = self.DBSession()
+        session = self.read_session()
         query = session.query(Resource.rid)
 
         if item_types:
@@ -112,8 +219,26 @@ class RDBStorage(object):
         for rid, in query.yield_per(self.batchsize):
             yield rid
 
+    def iter_models(self, *item_types):
+        ''' Stream resources with their current propsheets, keys and links.
+
+        Rids are read through a server side cursor and their resources loaded
+        ``batchsize`` at a time with the keys and links eagerly loaded, so a
+        full pass costs a few queries per batch rather than per item.
+        '''
+        session = self.read_session()
+        for batch in self._batches(self.__iter__(*item_types)):
+            query = session.query(Resource).filter(
+                Resource.rid.in_(batch),
+            ).options(
+                orm.subqueryload('unique_keys'),
+                orm.subqueryload('rels'),
+            )
+            for model in query:
+                yield model
+
     def __len__(self, *item_types):
-        session = self.DBSession()
+        session = self.read_session()
         query = session.query(Resource.rid)
 
         if item_types:
@@ -158,6 +283,133 @@ class RDBStorage(object):
         msg = 'Keys conflict: %r' % conflicts
         raise HTTPConflict(msg)
 
+    def bulk_update(self, updates):
+        ''' Apply many updates with one flush and no savepoints.
+
+        ``updates`` is a sequence of ``(model, properties, sheets, unique_keys,
+        links)`` tuples as passed to ``update``. Keys and links are written
+        with multi-row INSERT and DELETE statements.
+
+        Items that would conflict are skipped. Returns a set of the uuids
+        changed and a dict of conflict messages keyed by uuid.
+        '''
+        session = self.DBSession()
+        updates = list(updates)
+        changed = set()
+        errors = {}
+        if not updates:
+            return changed, errors
+
+        new_rids = [
+            model.rid for model, properties, sheets, unique_keys, links in updates
+            if orm.object_session(model) is None
+        ]
+        existing_rids = set()
+        for batch in self._batches(new_rids):
+            existing_rids.update(
+                rid for rid, in session.query(Resource.rid).filter(Resource.rid.in_(batch)))
+
+        rids = [model.rid for model, properties, sheets, unique_keys, links in updates]
+        existing_keys = defaultdict(set)
+        existing_rels = defaultdict(set)
+        for batch in self._batches(rids):
+            query = session.query(Key.rid, Key.name, Key.value).filter(Key.rid.in_(batch))
+            for rid, name, value in query:
+                existing_keys[rid].add((name, value))
+            query = session.query(Link.source_rid, Link.rel, Link.target_rid).filter(
+                Link.source_rid.in_(batch))
+            for source, rel, target in query:
+                existing_rels[source].add((rel, target))
+
+        changes = []
+        for model, properties, sheets, unique_keys, links in updates:
+            keys_add = keys_remove = rels_add = rels_remove = ()
+            if unique_keys is not None:
+                keys = {(k, v) for k, values in unique_keys.items() for v in values}
+                keys_add = keys - existing_keys[model.rid]
+                keys_remove = existing_keys[model.rid] - keys
+            if links is not None:
+                rels = {
+                    (k, uuid.UUID(target)) for k, targets in links.items() for target in targets
+                }
+                rels_add = rels - existing_rels[model.rid]
+                rels_remove = existing_rels[model.rid] - rels
+            changes.append(
+                (model, properties, sheets, keys_add, keys_remove, rels_add, rels_remove))
+
+        # Owners of every key about to be added. Updated as each item is
+        # accepted so keys may move between items within the batch.
+        wanted = [pk for change in changes for pk in change[3]]
+        owners = {}
+        for batch in self._batches(wanted):
+            query = session.query(Key.name, Key.value, Key.rid).filter(
+                tuple_(Key.name, Key.value).in_(batch))
+            for name, value, rid in query:
+                owners[(name, value)] = rid
+
+        accepted = []
+        keys_to_add = []
+        keys_to_remove = []
+        rels_to_add = []
+        rels_to_remove = []
+        for model, properties, sheets, keys_add, keys_remove, rels_add, rels_remove in changes:
+            rid = model.rid
+            if rid in existing_rids:
+                errors[str(rid)] = 'UUID conflict'
+                continue
+            conflicts = [pk for pk in keys_add if owners.get(pk, rid) != rid]
+            if conflicts:
+                errors[str(rid)] = 'Keys conflict: %r' % conflicts
+                continue
+            for pk in keys_remove:
+                owners.pop(pk, None)
+            for pk in keys_add:
+                owners[pk] = rid
+
+            session.add(model)
+            self._update_properties(model, properties, sheets)
+            accepted.append(model)
+            keys_to_remove.extend(keys_remove)
+            keys_to_add.extend(
+                {'name': name, 'value': value, 'rid': rid} for name, value in keys_add)
+            rels_to_remove.extend((rid, rel, target) for rel, target in rels_remove)
+            rels_to_add.extend(
+                {'source': rid, 'rel': rel, 'target': target} for rel, target in rels_add)
+            if properties is not None or sheets or keys_add or keys_remove \
+                    or rels_add or rels_remove:
+                changed.add(str(rid))
+
+        session.flush()
+
+        keys_table = Key.__table__
+        links_table = Link.__table__
+        for batch in self._batches(keys_to_remove):
+            session.execute(keys_table.delete().where(
+                tuple_(keys_table.c.name, keys_table.c.value).in_(batch)))
+        for batch in self._batches(rels_to_remove):
+            session.execute(links_table.delete().where(
+                tuple_(links_table.c.source, links_table.c.rel, links_table.c.target).in_(batch)))
+        for batch in self._batches(keys_to_add):
+            session.execute(keys_table.insert().values(batch))
+        for batch in self._batches(rels_to_add):
+            session.execute(links_table.insert().values(batch))
+
+        if keys_to_remove or rels_to_remove or keys_to_add or rels_to_add:
+            # Core statements bypass the ORM and zope.sqlalchemy
+            for model in accepted:
+                session.expire(model, ['unique_keys', 'rels'])
+            mark_changed(session)
+
+        return changed, errors
+
+    def _batches(self, values):
+        values = iter(values)
+        while True:
+            batch = list(islice(values, self.batchsize))
+            if not batch:
+                return
+            yield batch
+
     def _update_properties(self, model, properties, sheets=None):
         if properties is not None:
             model.propsheets[''] = properties
@@ -212,6 +464,150 @@ class RDBStorage(object):
         return to_add, to_remove
 
 
+def is_read_only_transaction():
+    """ Doomed transactions and GET/HEAD requests never write.
+    """
+    if transaction.get().isDoomed():
+        return True
+    request = get_root_request()
+    return request is not None and request.method in ('GET', 'HEAD')
+
+
+class SnapshotResource(object):
+    """ Read only copy of a Resource which may be shared between transactions.
+    """
+    def __init__(self, model):
+        self.rid = model.rid
+        self.item_type = model.item_type
+        self.tid = model.tid
+        self.propsheets = dict(model.items())
+        # Approximate memory use
+        self.size = len(json_renderer.dumps(self.propsheets))
+
+    @property
+    def properties(self):
+        return self.propsheets['']
+
+    @property
+    def uuid(self):
+        return self.rid
+
+    def invalidated(self):
+        return False
+
+    def used_for(self, item):
+        pass
+
+
+class ModelCache(object):
+    """ Process wide cache of resources for read only transactions.
+
+    Once per transaction the ``transactions`` table is read back to the
+    cache's xmin and the ``updated`` uuids of each transaction record are
+    evicted. A record without ``updated`` (e.g. batch upgrade) clears the
+    cache. Entries are only served to transactions whose snapshot is at least
+    as new as the one they were loaded from.
+    """
+    xmin_key = '_snowfort_model_cache_xmin'
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.xmin = None
+        self.entries = OrderedDict()  # rid -> (xmin, model, keys)
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def validate(self, session):
+        """ Apply invalidations visible to this transaction and return its xmin.
+        """
+        data = transaction.get()._extension
+        xmin = data.get(self.xmin_key)
+        if xmin is not None:
+            return xmin
+        connection = session.connection()
+        xmin = connection.execute(
+            "SELECT txid_snapshot_xmin(txid_current_snapshot());").scalar()
+        last_xmin = self.xmin
+        updated = set()
+        clear = False
+        if last_xmin is not None:
+            records = session.query(TransactionRecord.data).filter(
+                TransactionRecord.xid >= last_xmin)
+            for record_data, in records:
+                if record_data is None or 'updated' not in record_data:
+                    clear = True
+                    break
+                updated.update(record_data['updated'])
+        # Evict and advance xmin together, otherwise a model loaded from an
+        # older snapshot could be added in between and never be evicted.
+        with self.lock:
+            if clear:
+                self.clear()
+            else:
+                for rid in updated:
+                    self._evict(uuid.UUID(rid))
+            if self.xmin is None or xmin > self.xmin:
+                self.xmin = xmin
+        data[self.xmin_key] = xmin
+        return xmin
+
+    def get(self, rid, xmin):
+        with self.lock:
+            entry = self.entries.get(rid)
+            if entry is None or entry[0] > xmin:
+                return None
+            # Mark as most recently used
+            del self.entries[rid]
+            self.entries[rid] = entry
+            return entry[1]
+
+    def get_by_key(self, pkey, xmin):
+        rid = self.keys.get(pkey)
+        if rid is None:
+            return None
+        return self.get(rid, xmin)
+
+    def add(self, model, xmin, pkey=None):
+        """ Returns a snapshot of the model, stored when fresh enough.
+        """
+        snapshot = SnapshotResource(model)
+        if snapshot.size > self.max_size:
+            return snapshot
+        with self.lock:
+            # Loaded from a snapshot older than already applied invalidations
+            if self.xmin is None or xmin < self.xmin:
+                return snapshot
+            keys = set()
+            existing = self.entries.pop(snapshot.rid, None)
+            if existing is not None:
+                self.size -= existing[1].size
+                keys = existing[2]
+            if pkey is not None:
+                keys.add(pkey)
+                self.keys[pkey] = snapshot.rid
+            self.entries[snapshot.rid] = (xmin, snapshot, keys)
+            self.size += snapshot.size
+            while self.size > self.max_size:
+                self._evict(next(iter(self.entries)))
+        return snapshot
+
+    def clear(self):
+        self.entries.clear()
+        self.keys.clear()
+        self.size = 0
+
+    def _evict(self, rid):
+        entry = self.entries.pop(rid, None)
+        if entry is None:
+            return
+        xmin, model, keys = entry
+        self.size -= model.size
+        for pkey in keys:
+            if self.keys.get(pkey) == rid:
+                del self.keys[pkey]
+
+
 class UUID(types.TypeDecorator):
     """Platform-independent UUID type.
 
@@ -267,9 +663,67 @@ class RDBBlobStorage(object):
         blob = session.query(Blob).get(blob_id)
         return blob.data
 
+    def open_blob(self, download_meta):
+        ''' Returns an RDBBlob for streaming the data, or None if missing.
+        '''
+        blob_id = download_meta['blob_id']
+        if isinstance(blob_id, str):
+            blob_id = uuid.UUID(blob_id)
+        session = self.DBSession()
+        size = session.query(func.length(Blob.data)).filter(
+            Blob.blob_id == blob_id).scalar()
+        if size is None:
+            return None
+        return RDBBlob(session.get_bind(), blob_id, size)
+
+
+class RDBBlob(object):
+    """ Blob data read in chunks with substring().
+
+    Usable as a response app_iter, including for Range requests. Reads use
+    their own connection so the response may be streamed after the request
+    transaction has ended, which is safe as blobs are never modified.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, bind, blob_id, size):
+        self.bind = bind
+        self.blob_id = blob_id
+        self.size = size
+
+    def __iter__(self):
+        return self.app_iter_range(0, self.size)
+
+    def app_iter_range(self, start, stop):
+        if stop is None or stop > self.size:
+            stop = self.size
+        query = Blob.__table__.select().with_only_columns([
+            func.substring(Blob.data, bindparam('start'), bindparam('length')),
+        ]).where(Blob.blob_id == self.blob_id)
+        connection = self.bind.connect()
+        try:
+            while start < stop:
+                length = min(self.chunk_size, stop - start)
+                # substring() offsets are 1 based
+                chunk = connection.execute(query, start=start + 1, length=length).scalar()
+                if not chunk:
+                    # Deleted, or shorter than when the response began
+                    raise IOError(
+                        'Blob %s ended at byte %d of %d' % (self.blob_id, start, self.size))
+                yield bytes(chunk)
+                start += length
+        finally:
+            connection.close()
+
 
 class S3BlobStorage(object):
-    def __init__(self, bucket, read_profile_name=None, store_profile_name=None):
+    """ Blobs stored in S3.
+
+    Downloads are redirected to a signed url unless ``redirect`` is false, in
+    which case the data is streamed through ``open_blob``.
+    """
+    def __init__(self, bucket, read_profile_name=None, store_profile_name=None, redirect=True):
+        self.redirect = redirect
         self.store_conn = boto.connect_s3(profile_name=store_profile_name)
         self.read_conn = boto.connect_s3(profile_name=read_profile_name)
         self.bucket = self.store_conn.get_bucket(bucket, validate=False)
@@ -307,6 +761,45 @@ class S3BlobStorage(object):
         key_obj = bucket.get_key(key, validate=False)
         return key_obj.get_contents_as_string()
 
+    def open_blob(self, download_meta):
+        ''' Returns an S3Blob for streaming the data, or None if missing.
+        '''
+        bucket_name, key = self._get_bucket_key(download_meta)
+        bucket = self.read_conn.get_bucket(bucket_name, validate=False)
+        key_obj = bucket.get_key(key)
+        if key_obj is None:
+            return None
+        return S3Blob(key_obj)
+
+
+class S3Blob(object):
+    """ S3 object data streamed in chunks, with ranged GETs for Range requests.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, key):
+        self.key = key
+        self.size = key.size
+
+    def __iter__(self):
+        return self.app_iter_range(0, self.size)
+
+    def app_iter_range(self, start, stop):
+        if stop is None or stop > self.size:
+            stop = self.size
+        if start >= stop:
+            return
+        key = self.key.bucket.get_key(self.key.name, validate=False)
+        key.open_read(headers={'Range': 'bytes=%d-%d' % (start, stop - 1)})
+        try:
+            while True:
+                chunk = key.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            key.close()
+
 
 class JSON(types.TypeDecorator):
     """Represents an immutable structure as a json-encoded string.
@@ -362,12 +855,15 @@ class Link(Base):
     """ indexed relations
     """
     __tablename__ = 'links'
+    __table_args__ = (
+        # Composite index for reverse lookup by (target, rel)
+        schema.Index('ix_links_target_rel', 'target', 'rel'),
+    )
     source_rid = Column(
         'source', UUID, ForeignKey('resources.rid'), primary_key=True)
     rel = Column(types.String, primary_key=True)
     target_rid = Column(
-        'target', UUID, ForeignKey('resources.rid'), primary_key=True,
-        index=True)  # Single column index for reverse lookup
+        'target', UUID, ForeignKey('resources.rid'), primary_key=True)
 
     source = orm.relationship(
         'Resource', foreign_keys=[source_rid], backref='rels')
@@ -375,6 +871,51 @@ class Link(Base):
         'Resource', foreign_keys=[target_rid], backref='revs')
 
 
+class Dependency(Base):
+    """ Reverse index of the uuids each indexed document was rendered from
+
+    Recorded by the indexer from the embedded and linked uuids of each
+    document so that invalidation is an indexed lookup. ``xmin`` is that of
+    the snapshot the document was rendered in.
+    """
+    __tablename__ = 'dependencies'
+    embedded_uuid = Column(UUID, primary_key=True)
+    uuid = Column(UUID, primary_key=True, index=True)
+    embedded = Column(types.Boolean, nullable=False, default=False)
+    linked = Column(types.Boolean, nullable=False, default=False)
+    xmin = Column(types.BigInteger, nullable=False, default=0)
+
+
+class IndexQueue(Base):
+    """ Batches of uuids to index, claimed by distributed indexer workers
+    """
+    __tablename__ = 'index_queue'
+    id = Column(types.Integer, autoincrement=True, primary_key=True)
+    job = Column(UUID, nullable=False, index=True)
+    xmin = Column(types.BigInteger, nullable=False)
+    snapshot_id = Column(types.String)
+    index_name = Column(types.String, nullable=False)
+    uuids = Column(JSON, nullable=False)
+    done = Column(types.Boolean, nullable=False, default=False)
+    attempts = Column(types.Integer, nullable=False, default=0)
+    errors = Column(JSON)
+    stats = Column(JSON)
+    created = Column(
+        types.DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class SearchCacheEntry(Base):
+    """ Serialized search responses shared by the web processes
+
+    One row per query, replaced when the index generation moves on.
+    """
+    __tablename__ = 'search_cache'
+    key = Column(types.String, primary_key=True)
+    generation = Column(types.String, nullable=False)
+    status = Column(types.Integer, nullable=False)
+    value = Column(types.Text, nullable=False)
+
+
 class PropertySheet(Base):
     '''A triple describing a resource
     '''
@@ -509,7 +1050,7 @@ class TransactionRecord(Base):
     timestamp = Column(
         types.DateTime(timezone=True), nullable=False, server_default=func.now())
     # A server_default is necessary for the notify_ddl overwrite to work
-    xid = Column(types.BigInteger, nullable=True, server_default=null())
+    xid = Column(types.BigInteger, nullable=True, server_default=null(), index=True)
     __mapper_args__ = {
         'eager_defaults': True,
     }
@@ -534,6 +1075,13 @@ event.listen(
     notify_ddl.execute_if(dialect='postgresql'),
 )
 
+# Store blob data uncompressed so substring() reads only the chunks needed.
+event.listen(
+    Blob.__table__, 'after_create',
+    DDL('ALTER TABLE %(table)s ALTER COLUMN "data" SET STORAGE EXTERNAL;').execute_if(
+        dialect='postgresql'),
+)
+
 
 @event.listens_for(PropertySheet, 'before_insert')
 def set_tid(mapper, connection, target):
@@ -0,0 +1,50 @@
+def test_sized_lru_cache_evicts_by_size():
+    from snowfort.cache import SizedLRUCache
+    cache = SizedLRUCache(10, sizeof=len)
+    cache['a'] = 'aaaa'
+    cache['b'] = 'bbbb'
+    assert cache['a'] == 'aaaa'
+    cache['c'] = 'cccc'
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert cache.size == 8
+
+
+def test_sized_lru_cache_skips_oversized():
+    from snowfort.cache import SizedLRUCache
+    cache = SizedLRUCache(10, sizeof=len)
+    cache['a'] = 'aaaa'
+    cache['b'] = 'b' * 11
+    assert 'b' not in cache
+    assert cache.size == 4
+
+
+def test_manager_lru_cache_stats():
+    from pyramid.registry import Registry
+    from pyramid.threadlocal import manager
+    from snowfort.cache import ManagerLRUCache
+
+    class Request(object):
+        def __init__(self):
+            self._stats = {}
+
+    registry = Registry()
+    registry.settings = {'snowfort.test_cache.size': '1KB'}
+    request = Request()
+    cache = ManagerLRUCache('snowfort.test_cache')
+    manager.push({'registry': registry, 'request': request})
+    try:
+        cache['a'] = 'aaaa'
+        assert cache.get('a') == 'aaaa'
+        assert cache.get('b') is None
+        cache['b'] = 'b' * 2000
+        cache['c'] = 'c' * 600
+        cache['d'] = 'd' * 600
+    finally:
+        manager.pop()
+    assert request._stats == {
+        'test_cache_hits': 1,
+        'test_cache_misses': 1,
+        'test_cache_rejected': 1,
+        'test_cache_evictions': 2,
+    }
@@ -0,0 +1,168 @@
+import pytest
+
+
+class DummyIndexer(object):
+    def __init__(self, fail=False):
+        self.written = []
+        self.fail = fail
+
+    def index_documents(self, documents, xmin, index=None, stats=None):
+        if self.fail:
+            raise ValueError('write failed')
+        self.written.extend(documents)
+        stats['skipped'] = stats.get('skipped', 0) + 1
+        return [{'error': 'bad', 'uuid': documents[0]}]
+
+
+def test_bulk_writer():
+    from snowfort.elasticsearch.indexer import BulkWriter
+    indexer = DummyIndexer()
+    writer = BulkWriter(indexer, 1, maxsize=1)
+    writer.start()
+    writer.put(['a', 'b'])
+    writer.put(['c'])
+    writer.close()
+    assert indexer.written == ['a', 'b', 'c']
+    assert [error['uuid'] for error in writer.errors] == ['a', 'c']
+    assert writer.stats == {'skipped': 2}
+
+
+def test_bulk_writer_error():
+    from snowfort.elasticsearch.indexer import BulkWriter
+    writer = BulkWriter(DummyIndexer(fail=True), 1, maxsize=1)
+    writer.start()
+    writer.put(['a'])
+    writer.put(['b'])
+    with pytest.raises(ValueError):
+        writer.close()
+    with pytest.raises(ValueError):
+        writer.put(['c'])
+
+
+class DummyRequest(object):
+    def __init__(self):
+        self._stats = {'db_count': 5}
+
+    def embed(self, path, as_user=None):
+        self._stats['db_count'] += 2
+        self._stats['db_time'] = self._stats.get('db_time', 0) + 3000
+        self._stats['embedded_time'] = self._stats.get('embedded_time', 0) + 1000
+        uuid = path.split('/')[1]
+        return {
+            'item_type': 'a' if uuid.startswith('a') else 'b',
+            'embedded_uuids': [uuid],
+            'linked_uuids': [],
+        }
+
+
+def dummy_indexer():
+    from snowfort.elasticsearch.indexer import Indexer
+    import json
+
+    class Serializer(object):
+        dumps = staticmethod(json.dumps)
+
+    class Transport(object):
+        serializer = Serializer()
+
+    class ES(object):
+        transport = Transport()
+
+    indexer = Indexer.__new__(Indexer)
+    indexer.es = ES()
+    indexer.record_timings = False
+    return indexer
+
+
+def test_render_object_type_stats():
+    indexer = dummy_indexer()
+    request = DummyRequest()
+    stats = {}
+    for uuid in ['a1', 'a2', 'b1']:
+        document, error = indexer.render_object(request, uuid, stats)
+        assert error is None
+    a = stats['types']['a']
+    assert a['rendered'] == 2
+    assert a['db_count'] == 4
+    assert a['db_time'] == 0.006
+    assert a['embedded_time'] == 0.002
+    assert a['audit_time'] == 0
+    assert stats['types']['b']['db_count'] == 2
+
+
+def test_index_documents_type_stats():
+    indexer = dummy_indexer()
+    request = DummyRequest()
+    documents = [indexer.render_object(request, uuid)[0] for uuid in ['a1', 'a2', 'b1']]
+    indexer.unchanged = lambda documents, index: {'a1'}
+    indexer.bulk_index = lambda documents, xmin, index: [{'error': 'bad', 'uuid': 'b1'}]
+    recorded = []
+    indexer.update_dependencies = lambda documents, xmin: recorded.extend(documents)
+    stats = {}
+    assert [error['uuid'] for error in indexer.index_documents(documents, 1, stats=stats)] == ['b1']
+    # Failed writes don't record dependencies
+    assert sorted(doc.uuid for doc in recorded) == ['a1', 'a2']
+    assert stats['skipped'] == 1
+    assert stats['types']['a']['skipped'] == 1
+    assert stats['types']['a']['written'] == 1
+    assert stats['types']['b']['written'] == 0
+    assert stats['types']['b']['failed'] == 1
+    assert stats['types']['b']['write_time'] == 0
+    assert stats['types']['a']['rendered'] == 0
+
+
+class DummyMetaES(object):
+    """ Versioned storage of meta documents.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, index, doc_type, id):
+        from elasticsearch.exceptions import NotFoundError
+        if id not in self.docs:
+            raise NotFoundError(404, 'missing')
+        source, version = self.docs[id]
+        return {'_source': source, '_version': version}
+
+    def index(self, index, doc_type, body, id, version=None, op_type=None):
+        from elasticsearch.exceptions import ConflictError
+        current = self.docs.get(id, (None, 0))[1]
+        if (op_type == 'create' and current) or (version is not None and version != current):
+            raise ConflictError(409, 'conflict')
+        self.docs[id] = (body, current + 1)
+
+    def delete(self, index, doc_type, id, version=None):
+        from elasticsearch.exceptions import ConflictError
+        if version is not None and version != self.docs[id][1]:
+            raise ConflictError(409, 'conflict')
+        del self.docs[id]
+
+
+def test_update_referencing():
+    from snowfort.elasticsearch.indexer import update_referencing
+    es = DummyMetaES()
+    assert update_referencing(es, 'i') == {'uuids': [], 'since': None}
+    update_referencing(es, 'i', add={'b', 'a'}, since=10.0)
+    pending = update_referencing(es, 'i', add={'c'}, since=5.0)
+    assert pending == {'uuids': ['a', 'b', 'c'], 'since': 5.0}
+    pending = update_referencing(es, 'i', remove=['a', 'b', 'c'])
+    assert pending == {'uuids': [], 'since': 5.0}
+    assert 'referencing' not in es.docs
+
+
+def test_update_referencing_conflict():
+    from snowfort.elasticsearch.indexer import update_referencing
+    es = DummyMetaES()
+    get = es.get
+
+    def racing_get(**kw):
+        # Another pass stores its uuids after this one reads.
+        es.get = get
+        result = get(**kw)
+        es.docs['referencing'] = ({'uuids': ['z'], 'since': 1.0}, 2)
+        return result
+
+    es.docs['referencing'] = ({'uuids': ['x'], 'since': 2.0}, 1)
+    es.get = racing_get
+    pending = update_referencing(es, 'i', add={'y'}, since=3.0)
+    assert pending == {'uuids': ['y', 'z'], 'since': 1.0}
@@ -0,0 +1,54 @@
+import pytest
+
+
+class DummyIndexer(object):
+    chunks_per_process = 4
+    processes = 2
+    bulk_count = 500
+
+    def __init__(self, costs, item_types):
+        self.costs = costs
+        self._item_types = item_types
+
+    def item_types(self, request, uuids):
+        return self._item_types
+
+
+@pytest.fixture
+def schedule():
+    from snowfort.elasticsearch.mpindexer import MPIndexer
+    return MPIndexer.schedule
+
+
+def test_schedule_longest_first(schedule):
+    item_types = {'a%d' % i: 'cheap' for i in range(80)}
+    item_types.update(('b%d' % i, 'expensive') for i in range(8))
+    indexer = DummyIndexer({'cheap': 0.01, 'expensive': 1.0}, item_types)
+    chunks = schedule(indexer, None, sorted(item_types))
+    assert sorted(uuid for chunk in chunks for uuid in chunk) == sorted(item_types)
+    # Expensive items go in small chunks at the start
+    assert all(uuid.startswith('b') for uuid in chunks[0])
+    assert len(chunks[0]) == 1
+    assert all(uuid.startswith('a') for uuid in chunks[-1])
+
+
+def test_schedule_without_costs(schedule):
+    uuids = ['u%d' % i for i in range(64)]
+    indexer = DummyIndexer({}, {})
+    chunks = schedule(indexer, None, uuids)
+    assert len(chunks) == 8
+    assert sum(len(chunk) for chunk in chunks) == 64
+
+
+def test_schedule_zero_cost(schedule):
+    item_types = {'u%d' % i: 'free' for i in range(64)}
+    indexer = DummyIndexer({'free': 0.0}, item_types)
+    chunks = schedule(indexer, None, sorted(item_types))
+    assert sum(len(chunk) for chunk in chunks) == 64
+
+
+def test_merge_stats():
+    from snowfort.elasticsearch.indexer import merge_stats
+    stats = {'skipped': 1, 'types': {'a': {'rendered': 1}}}
+    merge_stats(stats, {'skipped': 2, 'types': {'a': {'rendered': 2}, 'b': {'rendered': 1}}})
+    assert stats == {'skipped': 3, 'types': {'a': {'rendered': 3}, 'b': {'rendered': 1}}}
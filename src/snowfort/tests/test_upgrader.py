@@ -51,3 +51,33 @@ def test_declarative_config():
     assert value['step1']
     assert value['step2']
     assert value['schema_version'] == '3'
+
+
+def test_upgrade_cache():
+    from snowfort.upgrader import UpgradeCache
+    cache = UpgradeCache(2)
+    key = ('uuid', 1, '', '3')
+    assert cache.get(key) is None
+    cache[key] = {'schema_version': '3'}
+    assert cache.get(key) == {'schema_version': '3'}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_upgrade_cache_disabled():
+    from snowfort.upgrader import UpgradeCache
+    cache = UpgradeCache(0)
+    cache[('uuid', 1, '', '3')] = {}
+    assert cache.get(('uuid', 1, '', '3')) is None
+
+
+def test_upgrade_cache_without_stats():
+    from pyramid.threadlocal import manager
+    from snowfort.upgrader import UpgradeCache
+    cache = UpgradeCache(2)
+    # e.g. a script's request, created outside the stats tween
+    manager.push({'request': object(), 'registry': None})
+    try:
+        assert cache.get(('uuid', 1, '', '3')) is None
+    finally:
+        manager.pop()
+    assert cache.misses == 1
@@ -7,12 +7,15 @@ from pyramid.interfaces import (
     PHASE1_CONFIG,
 )
 from .interfaces import PHASE2_5_CONFIG
+from .util import get_root_request
+from sqlalchemy.util import LRUCache
 import venusian
 
 
 def includeme(config):
     config.include('.typeinfo')
-    config.registry[UPGRADER] = Upgrader(config.registry)
+    capacity = int(config.registry.settings.get('upgrade_cache.capacity', 1000))
+    config.registry[UPGRADER] = Upgrader(config.registry, UpgradeCache(capacity))
     config.add_directive('add_upgrade', add_upgrade)
     config.add_directive('add_upgrade_step', add_upgrade_step)
     config.add_directive('set_upgrade_finalizer', set_upgrade_finalizer)
@@ -38,11 +41,52 @@ class VersionTooHigh(UpgradeError):
     pass
 
 
+class UpgradeCache(object):
+    """ Bounded cache of upgraded item properties.
+
+    Keyed by (uuid, tid, current_version, target_version) so an item stored
+    at an old schema version is only upgraded again once it is modified.
+    Shared by all requests in the process. A capacity of 0 disables it.
+    """
+    def __init__(self, capacity=1000):
+        self.cache = LRUCache(capacity) if capacity else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self.cache is None:
+            return None
+        try:
+            value = self.cache[key]
+        except KeyError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def __setitem__(self, key, value):
+        if self.cache is not None:
+            self.cache[key] = value
+
+    def _count(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+        stats = getattr(get_root_request(), '_stats', None)
+        if stats is None:
+            return
+        stats_key = 'upgrade_cache_' + name
+        stats[stats_key] = stats.get(stats_key, 0) + 1
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
 class Upgrader(object):
     """ Upgrade manager
     """
-    def __init__(self, registry):
+    def __init__(self, registry, cache=None):
         self.types = registry[TYPES]
+        self.cache = UpgradeCache(0) if cache is None else cache
         self.schema_upgraders = {}
         self.default_finalizer = None
 
@@ -36,6 +36,11 @@ def simple_path_ids(obj, path):
 
 
 def expand_path(request, obj, path):
+    """ Replace links along path with their embedded objects.
+
+    ``obj`` is modified in place, but containers below it are copied before
+    being changed as they may be shared through the embed cache.
+    """
     if isinstance(path, basestring):
         path = path.split('.')
     if not path:
@@ -46,14 +51,21 @@ def expand_path(request, obj, path):
     if value is None:
         return
     if isinstance(value, list):
+        value = obj[name] = list(value)
         for index, member in enumerate(value):
             if not isinstance(member, dict):
-                member = value[index] = request.embed(member, '@@object')
-            expand_path(request, member, remaining)
+                member = request.embed(member, '@@object')
+            if remaining:
+                member = dict(member)
+                expand_path(request, member, remaining)
+            value[index] = member
     else:
         if not isinstance(value, dict):
-            value = obj[name] = request.embed(value, '@@object')
-        expand_path(request, value, remaining)
+            value = request.embed(value, '@@object')
+        if remaining:
+            value = dict(value)
+            expand_path(request, value, remaining)
+        obj[name] = value
 
 
 def select_distinct_values(request, value_path, *from_paths):